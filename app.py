@@ -1,143 +1,204 @@
 import gradio as gr
 import asyncio
-import threading
 import time
 import os
 from datetime import datetime
 from src import SJTRunner, DataLoader
 import json
 
+class GenerationProgress:
+    """单次生成的进度状态；每次点击生成各用一份，不同会话互不干扰"""
+
+    def __init__(self, status="initializing", details="正在初始化..."):
+        self.info = {"current": 0, "total": 0, "status": status, "details": details, "stream": ""}
+        self._streams: dict[str, str] = {}
+        self._queue = asyncio.Queue()
+
+    def publish(self, **changes):
+        """合并进度变化并推送到进度队列"""
+        self.info.update(changes)
+        self._queue.put_nowait(self.info.copy())
+
+    def update_progress(self, current, total, details=""):
+        """更新进度信息"""
+        if details:
+            self.publish(current=current, total=total, details=details)
+        else:
+            self.publish(current=current, total=total)
+
+    def update_stream(self, stage, chunk):
+        """累积某一步请求的流式输出，推送该步当前的完整文本"""
+        self._streams[stage] = self._streams.get(stage, "") + chunk
+        self.publish(stream=f"[{stage}]\n{self._streams[stage]}")
+
+    async def next(self):
+        """取下一条进度；流式输出导致消息积压时只保留最新一条"""
+        info = await self._queue.get()
+        while not self._queue.empty():
+            info = self._queue.get_nowait()
+        return info
+
 class SJTGradioApp:
     def __init__(self):
         self.data_loader = DataLoader()
-        self.runner = None
-        self.progress_info = {"current": 0, "total": 0, "status": "ready", "details": ""}
         self.results = None
+        self._scale_cache: dict[str, tuple] = {}
+        self._trait_display_to_code: dict[str, str] = {}
 
     def load_scale_data(self, scale_name):
-        """加载量表数据"""
+        """加载量表数据（按量表名缓存，下拉框/多选框事件不再重复解析JSON）"""
+        if scale_name in self._scale_cache:
+            return self._scale_cache[scale_name]
         try:
             scale_data = self.data_loader.load(scale_name, 'zh')
             scale_meta = self.data_loader.load_meta(scale_name)
             available_traits = list(scale_data.keys())
             trait_names = [f"{trait}: {scale_data[trait]['facet_name']}" for trait in available_traits]
-            return scale_data, scale_meta, available_traits, trait_names
+            self._scale_cache[scale_name] = (scale_data, scale_meta, available_traits, trait_names)
+            return self._scale_cache[scale_name]
         except Exception as e:
             return None, None, [], [f"错误: {str(e)}"]
 
     def update_traits_choices(self, scale_name):
         """更新特质选择列表"""
         _, _, available_traits, trait_names = self.load_scale_data(scale_name)
+        self._trait_display_to_code = dict(zip(trait_names, available_traits))
         return gr.CheckboxGroup(choices=trait_names, value=[], label="选择特质")
 
-    def extract_trait_codes(self, selected_traits, scale_name):
+    def extract_trait_codes(self, selected_traits):
         """从选择的特质名称中提取特质代码"""
-        scale_data, _, _, _ = self.load_scale_data(scale_name)
-        if not scale_data:
-            return []
-
-        trait_codes = []
-        for trait_display in selected_traits:
-            trait_code = trait_display.split(":")[0].strip()
-            if trait_code in scale_data:
-                trait_codes.append(trait_code)
-        return trait_codes
-
-    async def run_sjt_generation(self, scale_name, selected_traits, situation_theme,
-                                n_item, model_name, result_dir, result_filename):
-        """异步运行SJT生成"""
+        return [
+            self._trait_display_to_code[d]
+            for d in selected_traits
+            if d in self._trait_display_to_code
+        ]
+
+    async def run_sjt_generation(self, progress, scale_name, scale_data, scale_meta, selected_traits,
+                                situation_theme, n_item, model_name, result_dir, result_filename):
+        """异步运行SJT生成，进度写入本次生成自己的progress"""
         try:
-            # 重置进度信息
-            self.progress_info = {"current": 0, "total": 0, "status": "initializing", "details": "正在初始化..."}
-
-            # 加载数据
-            scale_data, scale_meta, _, _ = self.load_scale_data(scale_name)
             if not scale_data:
-                self.progress_info["status"] = "error"
-                self.progress_info["details"] = "无法加载量表数据"
+                progress.publish(status="error", details="无法加载量表数据")
                 return
 
             # 提取特质代码
-            trait_codes = self.extract_trait_codes(selected_traits, scale_name)
+            trait_codes = self.extract_trait_codes(selected_traits)
             if not trait_codes:
-                self.progress_info["status"] = "error"
-                self.progress_info["details"] = "请选择至少一个特质"
+                progress.publish(status="error", details="请选择至少一个特质")
                 return
 
-            # 初始化运行器
-            self.runner = SJTRunner(
+            # 初始化运行器（每次生成各用一个，不与其他会话共享）
+            runner = SJTRunner(
                 situation_theme=situation_theme,
                 scale=scale_data,
                 meta=scale_meta
             )
 
-            self.progress_info["status"] = "running"
-            self.progress_info["details"] = f"开始生成 {len(trait_codes)} 个特质的SJT题目..."
-            self.progress_info["total"] = len(trait_codes) * n_item
+            progress.publish(
+                status="running",
+                details=f"开始生成 {len(trait_codes)} 个特质的SJT题目...",
+                total=len(trait_codes) * n_item,
+            )
 
             # 创建结果目录
             os.makedirs(result_dir, exist_ok=True)
 
-            # 运行生成
-            results = await self.runner.cook_async(
+            # 运行生成（已处于事件循环中，直接await协程版本）
+            results = await runner.acook(
                 trait_codes,
+                items=runner.items,
+                confs=runner.confs,
                 n_item=n_item,
                 model=model_name,
-                save_results=True,
+                show_progress=False,
+                progress_callback=progress.update_progress,
+                on_delta=progress.update_stream,
+            )
+            # 写文件和生成docx是同步阻塞操作，放到线程中执行，不阻塞其他会话
+            await asyncio.to_thread(
+                runner.save_result,
+                all_items=results,
                 results_dir=result_dir,
                 detailed_fname=f"{result_filename}_detailed",
                 fname=result_filename,
-                progress_callback=self.update_progress
             )
 
             self.results = results
-            self.progress_info["status"] = "completed"
-            self.progress_info["details"] = f"生成完成！共生成 {len(results)} 道题目"
+            progress.publish(status="completed", details=f"生成完成！共生成 {len(results)} 道题目")
 
         except Exception as e:
-            self.progress_info["status"] = "error"
-            self.progress_info["details"] = f"生成过程中出现错误: {str(e)}"
+            progress.publish(status="error", details=f"生成过程中出现错误: {str(e)}")
+
+    def render_progress(self, info):
+        """将进度信息渲染为Markdown"""
+        if info["status"] == "ready":
+            progress_md = "### 🔄 等待开始..."
+        elif info["status"] == "initializing":
+            progress_md = "### ⚡ 正在初始化..."
+        elif info["status"] == "running":
+            percentage = (info["current"] / info["total"]) * 100 if info["total"] > 0 else 0
+            progress_md = f"""
+### 🎯 生成进行中...
 
-    def update_progress(self, current, total, details=""):
-        """更新进度信息"""
-        self.progress_info["current"] = current
-        self.progress_info["total"] = total
-        if details:
-            self.progress_info["details"] = details
-
-    def get_progress_info(self):
-        """获取当前进度信息"""
-        info = self.progress_info.copy()
-        if info["total"] > 0:
-            percentage = (info["current"] / info["total"]) * 100
-            info["percentage"] = percentage
+**进度:** {info['current']}/{info['total']} ({percentage:.1f}%)
+
+**详情:** {info['details']}
+            """
+        elif info["status"] == "completed":
+            progress_md = f"""
+### ✅ 生成完成！
+
+**结果:** {info['details']}
+
+请查看结果文件夹获取生成的SJT题目。
+            """
+        elif info["status"] == "error":
+            progress_md = f"""
+### ❌ 生成失败
+
+**错误信息:** {info['details']}
+
+请检查参数设置后重试。
+            """
         else:
-            info["percentage"] = 0
-        return info
+            progress_md = "### 🔄 状态未知..."
+
+        return progress_md
 
-    def start_generation(self, scale_name, selected_traits, situation_theme,
-                        n_item, model_name, result_dir, result_filename):
-        """启动生成过程"""
+    async def start_generation(self, scale_name, selected_traits, situation_theme,
+                               n_item, model_name, result_dir, result_filename):
+        """启动生成过程，并在进度变化时推送界面更新"""
         if not selected_traits:
-            return "请选择至少一个特质！"
-
-        # 在新线程中运行异步任务
-        def run_async():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(
-                self.run_sjt_generation(
-                    scale_name, selected_traits, situation_theme,
-                    n_item, model_name, result_dir, result_filename
-                )
-            )
-            loop.close()
+            yield "请选择至少一个特质！", self.render_progress(GenerationProgress("ready", "").info), ""
+            return
 
-        thread = threading.Thread(target=run_async)
-        thread.daemon = True
-        thread.start()
+        # 量表数据取自缓存，直接传入生成协程
+        scale_data, scale_meta, _, _ = self.load_scale_data(scale_name)
 
-        return "生成任务已启动，请查看进度面板..."
+        # 每次生成使用独立的进度状态，不会读到其他会话或上一轮的消息
+        progress = GenerationProgress()
+
+        # 生成任务直接跑在Gradio的事件循环上，与异步LLM客户端共用同一调度器；
+        # 句柄只保存在本次调用中，其他会话的生成不受影响
+        task = asyncio.create_task(
+            self.run_sjt_generation(
+                progress, scale_name, scale_data, scale_meta, selected_traits, situation_theme,
+                n_item, model_name, result_dir, result_filename
+            )
+        )
+        status = "生成任务已启动，请查看进度面板..."
+        yield status, self.render_progress(progress.info), ""
+
+        # 仅在进度实际变化时重绘；页面关闭或事件被取消时只取消本次的生成任务
+        try:
+            while True:
+                info = await progress.next()
+                yield status, self.render_progress(info), info["stream"]
+                if info["status"] in ("completed", "error"):
+                    break
+        finally:
+            if not task.done():
+                task.cancel()
 
 # 创建应用实例
 app = SJTGradioApp()
@@ -271,46 +332,14 @@ with gr.Blocks(css=custom_css, title="SJT Generator - Hugging Face Style", theme
                 elem_classes=["status-box"]
             )
 
-            # 自动刷新进度
-            def update_progress_display():
-                info = app.get_progress_info()
-
-                if info["status"] == "ready":
-                    progress_md = "### 🔄 等待开始..."
-                elif info["status"] == "initializing":
-                    progress_md = "### ⚡ 正在初始化..."
-                elif info["status"] == "running":
-                    percentage = info.get("percentage", 0)
-                    progress_md = f"""
-### 🎯 生成进行中...
-
-**进度:** {info['current']}/{info['total']} ({percentage:.1f}%)
-
-**详情:** {info['details']}
-                    """
-                elif info["status"] == "completed":
-                    progress_md = f"""
-### ✅ 生成完成！
-
-**结果:** {info['details']}
-
-请查看结果文件夹获取生成的SJT题目。
-                    """
-                elif info["status"] == "error":
-                    progress_md = f"""
-### ❌ 生成失败
-
-**错误信息:** {info['details']}
-
-请检查参数设置后重试。
-                    """
-                else:
-                    progress_md = "### 🔄 状态未知..."
-
-                return progress_md
-
-            # 定期更新进度
-            progress_timer = gr.Timer(1)  # 每秒更新一次
+            # 流式输出：显示最近更新的那一步LLM请求的实时文本
+            stream_text = gr.Textbox(
+                label="🧾 实时输出",
+                interactive=False,
+                lines=12,
+                max_lines=12,
+                autoscroll=True
+            )
 
     # 事件绑定
     scale_dropdown.change(
@@ -325,12 +354,7 @@ with gr.Blocks(css=custom_css, title="SJT Generator - Hugging Face Style", theme
             scale_dropdown, traits_checkbox, situation_theme,
             n_item, model_dropdown, result_dir, result_filename
         ],
-        outputs=[status_msg]
-    )
-
-    progress_timer.tick(
-        update_progress_display,
-        outputs=[progress_text]
+        outputs=[status_msg, progress_text, stream_text]
     )
 
     # 初始化特质选择
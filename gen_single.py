@@ -1,8 +1,9 @@
 # %%
 from src import SJTAgent, DataLoader
+from src.utils.io import dump_json
 import os.path as op
 import os
-import json
+from concurrent.futures import ThreadPoolExecutor
 #%%
 SITUATION_THEME = "日常生活中的普遍情景" #情境主题
 TARGET_POPULATION = '普通成年人' #目标人群
@@ -48,12 +49,14 @@ items = agent.run(
 # %%
 os.makedirs(RESULT_DIR, exist_ok=True)
 
-with open(op.join(RESULT_DIR, f'{RESULT_DETAILED_SJT_FN}.json'), 'w', encoding='utf-8') as f:
-    json.dump(items, f, ensure_ascii=False, indent=2)
-
-pure_items = {}
-for idx, sjt in enumerate(items['items'], 1):
-    pure_items[f'{idx}'] = sjt
-with open(os.path.join(RESULT_DIR, f'{RESULT_SJT_FN}.json'), 'w', encoding='utf-8') as f:
-    json.dump(pure_items, f, ensure_ascii=False, indent=2)
-#%%
+pure_items = {f'{idx}': sjt for idx, sjt in enumerate(items['items'], 1)}
+
+# 两个文件并发写入；详细结果供程序读取，不缩进
+with ThreadPoolExecutor(max_workers=2) as pool:
+    futures = [
+        pool.submit(dump_json, items, op.join(RESULT_DIR, f'{RESULT_DETAILED_SJT_FN}.json')),
+        pool.submit(dump_json, pure_items, op.join(RESULT_DIR, f'{RESULT_SJT_FN}.json'), indent=True),
+    ]
+for future in futures:
+    future.result()
+#%%
\ No newline at end of file
@@ -9,13 +9,18 @@ import asyncio
 import json
 import os
 import os.path as op
-from typing import Dict, List, Any
+import re
+from functools import lru_cache
+from typing import Dict, List, Any, Optional
 
-import lmitf
-from lmitf import TemplateLLM
 import src
+from src.batch_runner import BatchRunner
+from src.llm_client import AsyncBaseLLM, AsyncTemplateLLM, parse_response, response_format_param
+from src.utils.io import dump_json
 
-from tqdm.autonotebook import tqdm
+from pydantic import BaseModel, ConfigDict, Field, create_model
+
+from tqdm.asyncio import tqdm
 import argparse
 from dotenv import load_dotenv
 load_dotenv()
@@ -26,6 +31,17 @@ parser.add_argument('--model', type=str, default='gpt-4o',
                     help='Model to use for generation (default: gpt-4o)')
 parser.add_argument('--n_items', type=int, default=22,
                     help='Number of items to generate per trait (default: 22)')
+parser.add_argument('--max_concurrent', type=int, default=50,
+                    help='Maximum number of in-flight LLM requests across all traits (default: 50)')
+parser.add_argument('--krumm_history', type=str, default='summary', choices=['summary', 'full'],
+                    help='What earlier Krumm answers are kept in the conversation: the first sentence '
+                         'of each situation, or the full item JSON (default: summary)')
+li_mode = parser.add_mutually_exclusive_group()
+li_mode.add_argument('--batch', action='store_true',
+                     help='Submit the Li requests through the OpenAI Batch API (cheaper, completes offline)')
+li_mode.add_argument('--li_combined', action='store_true',
+                     help='Ask for the Li items of all traits in one request, '
+                          'retrying per trait for any trait that comes back short')
 
 args = parser.parse_args()
 
@@ -33,6 +49,10 @@ args = parser.parse_args()
 LANGUAGE = args.language
 MODEL = args.model
 N_ITEMS = args.n_items
+MAX_CONCURRENT = args.max_concurrent
+USE_BATCH = args.batch
+LI_COMBINED = args.li_combined
+KRUMM_HISTORY = args.krumm_history
 TRAITS = [
     "Openness-Openness to Ideas",
     "Conscientiousness-Self-Discipline", 
@@ -40,6 +60,15 @@ TRAITS = [
     "Agreeableness-Compliance",
     "Neuroticism-Self-Consciousness",
 ]
+# Instructions wrapped around the per-trait Li prompts in --li_combined mode
+LI_COMBINED_HEADER = {
+    'en': ("Complete each of the following {n} tasks. Return a single JSON object whose top-level keys are "
+           "exactly the trait names {traits}; the value for each trait is the JSON object its task asks for."),
+    'zh': ("请依次完成以下 {n} 个任务。输出一个 JSON 对象，其顶层键恰好为特质名称 {traits}，"
+           "每个特质对应的值为该任务要求输出的 JSON 对象。"),
+}
+# Domain part of each trait ("Openness-Openness to Ideas" -> "Openness"), used as data/result key
+TRAIT_KEYS = {trait: trait.split('-', 1)[0] for trait in TRAITS}
 krumm_prompt = f"Krumm_{LANGUAGE}.py"
 li_prompt = f"Li_{LANGUAGE}.py"
 # File paths
@@ -54,23 +83,49 @@ MUSSEL_SJT_PATH = op.join(DATASET_DIR, 'SJTs', 'Mussel.json')
 TRAIT_DEF_PATH = op.join(DATASET_DIR, 'trait_knowledge', 'def_bf.json')
 
 
+class SJTOptions(BaseModel):
+    """Four response options; A/B reflect high and C/D low levels of the trait."""
+    model_config = ConfigDict(extra='forbid')
+    A: str
+    B: str
+    C: str
+    D: str
+
+class SJTItem(BaseModel):
+    """One SJT item, enforced as the strict response schema of every call."""
+    model_config = ConfigDict(extra='forbid')
+    situation: str
+    options: SJTOptions
+
+@lru_cache(maxsize=None)
+def li_response_model(n_items: int) -> type[BaseModel]:
+    """Schema of a Li answer: items keyed "1".."n_items"."""
+    fields = {f'item_{i}': (SJTItem, Field(alias=str(i))) for i in range(1, n_items + 1)}
+    return create_model(f'LiSJT{n_items}', __config__=ConfigDict(extra='forbid'), **fields)
+
+def li_combined_model(traits: tuple[str, ...], n_items: int) -> type[BaseModel]:
+    """Schema of a combined Li answer: one Li answer per trait, keyed by trait name."""
+    fields = {f'trait_{j}': (li_response_model(n_items), Field(alias=trait)) for j, trait in enumerate(traits)}
+    return create_model('LiSJTCombined', __config__=ConfigDict(extra='forbid'), **fields)
+
 def load_data():
     """Load required datasets and templates."""
     dataloader = src.DataLoader()
     mussel_sjt = dataloader.load("PSJT-Mussel", LANGUAGE)
     trait_def = dataloader.load("_traits_definition", "en")  # Trait definitions
 
-    krumm_aig = TemplateLLM(KRUMM_PROMPT_PATH)
-    li_aig = TemplateLLM(LI_PROMPT_PATH)
+    krumm_aig = AsyncTemplateLLM(KRUMM_PROMPT_PATH)
+    li_aig = AsyncTemplateLLM(LI_PROMPT_PATH)
     
     return mussel_sjt, trait_def, krumm_aig, li_aig
 
 class BaseSJTGenerator:
     """Base class for SJT generators."""
     
-    def __init__(self, template: TemplateLLM):
+    def __init__(self, template: AsyncTemplateLLM, semaphore: asyncio.Semaphore):
         self.template_llm = template
-        self.base_llm = lmitf.BaseLLM()
+        self.base_llm = AsyncBaseLLM(coalesce=True)
+        self.semaphore = semaphore  # shared by all generators to cap in-flight requests
         self.history = None
 
     def _build_context_message(self, role: str, content: str) -> dict[str, str]:
@@ -80,8 +135,8 @@ class BaseSJTGenerator:
 class KrummGenerator(BaseSJTGenerator):
     """Krumm approach: Iterative SJT generation."""
 
-    def generate(self, trait: str, n_items: int, model: str = MODEL) -> dict[str, Any]:
-        """Generate SJT items iteratively."""
+    async def generate(self, trait: str, n_items: int, model: str = MODEL) -> dict[str, Any]:
+        """Generate SJT items iteratively (each request depends on the previous answers)."""
         if LANGUAGE == 'en':
             iter_prompt = (f"Can you create another SJT item measuring {trait}? "
                           "The described situation in the SJT should be different from the ones created before...")
@@ -89,134 +144,288 @@ class KrummGenerator(BaseSJTGenerator):
             iter_prompt = (f"你能够创建另一个测量{trait}的情境判断测验(SJT)项目吗?"
                           "SJT中描述的情景应与之前创建的情境不同...")
 
-        context = self.template_llm.prompt_template.copy()
+        # The history only ever grows by appending, so every request starts with
+        # the previous request verbatim and the provider's prefix cache covers it.
+        context = self.template_llm.render(Trait=trait)
         sjts = {trait: {}}
         
         for i in range(n_items):
             if i == 0:
                 # First iteration - use base template
-                response = self._call_llm(context, model)
+                response = await self._call_llm(context, model)
             else:
                 # Subsequent iterations - add iteration prompt
                 context.append(self._build_context_message('user', iter_prompt))
-                response = self._call_llm(context, model)
+                response = await self._call_llm(context, model)
             
-            context.append(self._build_context_message('assistant', str(response)))
+            context.append(self._build_context_message('assistant', self._history_entry(i, response)))
             sjts[trait][str(i+1)] = response
 
         self.history = context
         return sjts
     
-    def _call_llm(self, context: list[dict], model: str) -> Any:
+    def _history_entry(self, i: int, response: dict[str, Any]) -> str:
+        """What the conversation keeps of answer ``i``.
+
+        Only the earlier situations matter for keeping new items distinct, so by
+        default just the first sentence of each is kept instead of the whole item.
+        """
+        situation = response.get('situation') if isinstance(response, dict) else None
+        if KRUMM_HISTORY == 'full' or not isinstance(situation, str):
+            return json.dumps(response, ensure_ascii=False, separators=(',', ':'))
+        summary = re.split(r'(?<=[。！？.!?])', situation.strip(), maxsplit=1)[0]
+        label = f"Scenario {i+1}" if LANGUAGE == 'en' else f"情境{i+1}"
+        return f"{label}: {summary}"
+
+    async def _call_llm(self, context: list[dict], model: str) -> Any:
         """Call LLM with error handling."""
-        return self.base_llm.call(
-            messages=context,
-            model=model,
-            response_format='json',
-        )
+        async with self.semaphore:
+            return await self.base_llm.acall(
+                messages=context,
+                model=model,
+                response_format=SJTItem,
+            )
 
 
 class LiGenerator(BaseSJTGenerator):
     """Li approach: Batch SJT generation with examples."""
 
     def generate_reference_items(self, trait: str, dataset: dict, n_ref: int = 2) -> str:
-        """Generate reference items string from dataset."""
-        ref_items = []
-        for i in range(n_ref):
-            item = dataset[trait][str(i+1)]
-            ref_items.append({f"Scenario {i+1}": item})
-        return str(ref_items)
-
-    def generate(self, trait: str, trait_definition: str, dataset: dict, n_items: int, 
+        """Generate reference items string from dataset.
+
+        Serialized as JSON with ``ensure_ascii=False``: ``str()`` of the list
+        would use Python repr (single quotes, escaped quotes) in the prompt.
+        """
+        ref_items = [{f"Scenario {i+1}": dataset[trait][str(i+1)]} for i in range(n_ref)]
+        return json.dumps(ref_items, ensure_ascii=False)
+
+    def _template_vars(self, trait: str, trait_definition: str, dataset: dict, n_items: int) -> dict[str, Any]:
+        """Template variables of the Li prompt."""
+        return {
+            'Trait': trait,
+            'TraitDescription': trait_definition,
+            'Example': self.generate_reference_items(TRAIT_KEYS[trait], dataset),
+            'Nitem': n_items,
+        }
+
+    def build_request(self, trait: str, trait_definition: str, dataset: dict, n_items: int,
+                      model: str = MODEL) -> dict[str, Any]:
+        """Chat-completion request body for the Batch API."""
+        return {
+            'model': model,
+            'messages': self.template_llm.render(
+                **self._template_vars(trait, trait_definition, dataset, n_items)
+            ),
+            'response_format': response_format_param(li_response_model(n_items)),
+            'temperature': 1,
+        }
+
+    async def generate(self, trait: str, trait_definition: str, dataset: dict, n_items: int, 
                 model: str = MODEL) -> dict[str, Any]:
         """Generate SJT items using template approach."""
-        sjts = self.template_llm.call(
-            Trait=trait,
-            TraitDescription=trait_definition,
-            Example=self.generate_reference_items(trait.split('-')[0], dataset),
-            Nitem=n_items,
-            model=model,
-            response_format='json',
-            temperature=1,
-        )
+        # render() builds a new list per call, so it can be kept as the history without copying
+        messages = self.template_llm.render(**self._template_vars(trait, trait_definition, dataset, n_items))
+        async with self.semaphore:
+            sjts = await self.base_llm.acall(
+                messages=messages,
+                model=model,
+                response_format=li_response_model(n_items),
+                temperature=1,
+            )
         
-        self.history = self.template_llm.prompt_template.copy()
+        self.history = messages
         return {trait: sjts}
 
-async def generate_trait_sjts(trait: str, pbar, mussel_sjt: dict, trait_def: dict, 
-                              krumm_aig: TemplateLLM, li_aig: TemplateLLM) -> tuple:
-    """Generate SJTs for a single trait using both approaches."""
-    try:
-        # Create separate instances for each trait to avoid conflicts
-        krumm = KrummGenerator(krumm_aig)
-        li = LiGenerator(li_aig)
-        
-        # Run both generators concurrently for this trait
-        krumm_task = asyncio.to_thread(
-            krumm.generate, trait=trait, n_items=N_ITEMS, model=MODEL
-        )
-        li_task = asyncio.to_thread(
-            li.generate, trait=trait, trait_definition=trait_def[trait.split('-')[0]], 
+    async def generate_batch(self, traits: list[str], trait_def: dict, dataset: dict, n_items: int,
+                             model: str = MODEL) -> dict[str, Any]:
+        """Generate the items of all ``traits`` in one request.
+
+        Each trait's usual Li prompt becomes one section of a single message and
+        the model answers with one object keyed by trait. If that answer is
+        unusable (e.g. cut off at the output limit), or a trait has fewer than
+        ``n_items`` items, the affected traits are regenerated with ``generate``.
+        """
+        sections = [
+            f"### {trait}\n" + self.template_llm.render(
+                **self._template_vars(trait, trait_def[TRAIT_KEYS[trait]], dataset, n_items)
+            )[-1]['content']
+            for trait in traits
+        ]
+        header = LI_COMBINED_HEADER[LANGUAGE].format(n=len(traits), traits=json.dumps(traits, ensure_ascii=False))
+        try:
+            async with self.semaphore:
+                response = await self.base_llm.acall(
+                    messages=[self._build_context_message('user', '\n\n'.join([header, *sections]))],
+                    model=model,
+                    response_format=li_combined_model(tuple(traits), n_items),
+                    temperature=1,
+                )
+        except ValueError as e:  # invalid JSON or schema mismatch
+            tqdm.write(f"Combined Li request unusable, falling back to per-trait calls: {e}")
+            response = {}
+
+        results = {
+            trait: response[trait] for trait in traits
+            if isinstance(response.get(trait), dict) and len(response[trait]) >= n_items
+        }
+        retries = [
+            self.generate(trait=trait, trait_definition=trait_def[TRAIT_KEYS[trait]],
+                          dataset=dataset, n_items=n_items, model=model)
+            for trait in traits if trait not in results
+        ]
+        for result in await asyncio.gather(*retries):
+            results.update(result)
+        return {trait: results[trait] for trait in traits}
+
+def generate_li_batch(li: LiGenerator, mussel_sjt: dict, trait_def: dict,
+                      traits: list[str] = TRAITS) -> dict[str, Any]:
+    """Generate the Li items of ``traits`` in a single Batch API job."""
+    requests = {
+        trait: li.build_request(
+            trait=trait, trait_definition=trait_def[TRAIT_KEYS[trait]],
             dataset=mussel_sjt, n_items=N_ITEMS, model=MODEL
         )
+        for trait in traits
+    }
+    bodies = BatchRunner().run(requests)
+    missing = [trait for trait in traits if trait not in bodies]
+    if missing:
+        raise RuntimeError(f"Batch requests failed for traits: {missing}")
+    return {
+        trait: parse_response(BatchRunner.content(bodies[trait]), li_response_model(N_ITEMS))
+        for trait in traits
+    }
 
-        krumm_result, li_result = await asyncio.gather(krumm_task, li_task)
+async def generate_trait_sjts(trait: str, mussel_sjt: dict, trait_def: dict, 
+                              krumm_aig: AsyncTemplateLLM, li_aig: AsyncTemplateLLM,
+                              semaphore: asyncio.Semaphore, run_li: bool = True,
+                              run_krumm: bool = True) -> tuple:
+    """Generate SJTs for a single trait using both approaches (or only the ones asked for)."""
+    try:
+        # Create separate instances for each trait to avoid conflicts
+        krumm = KrummGenerator(krumm_aig, semaphore)
+        li = LiGenerator(li_aig, semaphore)
         
-        # Update progress bar
-        pbar.update(1)
-        pbar.set_description(f"Completed {trait}")
+        # Run both generators concurrently for this trait
+        jobs = []
+        if run_krumm:
+            jobs.append(krumm.generate(trait=trait, n_items=N_ITEMS, model=MODEL))
+        if run_li:
+            jobs.append(li.generate(
+                trait=trait, trait_definition=trait_def[TRAIT_KEYS[trait]], 
+                dataset=mussel_sjt, n_items=N_ITEMS, model=MODEL
+            ))
+        results = await asyncio.gather(*jobs)
+        krumm_result = results.pop(0) if run_krumm else {}
+        li_result = results.pop(0) if run_li else {}
         
         return trait, krumm_result, li_result
         
     except Exception as e:
-        pbar.write(f"Error processing {trait}: {e}")
+        tqdm.write(f"Error processing {trait}: {e}")
         raise
     
+def append_jsonl(path: str, record: dict[str, Any]) -> None:
+    """Append one record as a JSON line."""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+def read_jsonl(path: str) -> dict[str, Any]:
+    """Merge the per-trait JSON lines of ``path``; a missing file reads as empty.
+
+    A last line cut short by a crash is skipped (that trait is simply generated
+    again) and terminated, so the next append starts on a line of its own.
+    """
+    if not op.exists(path):
+        return {}
+    merged = {}
+    with open(path, encoding='utf-8') as f:
+        lines = f.readlines()
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            merged.update(json.loads(line))
+        except json.JSONDecodeError:
+            tqdm.write(f"Skipping an unreadable checkpoint line in {path}")
+    if lines and not lines[-1].endswith('\n'):
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('\n')
+    return merged
+
+def merge_jsonl(path: str) -> dict[str, Any]:
+    """Merge the per-trait JSON lines of ``path`` back into one dict in TRAITS order."""
+    merged = read_jsonl(path)
+    return {trait: merged[trait] for trait in TRAITS if trait in merged}
+
 async def process_all_traits(mussel_sjt: dict, trait_def: dict, 
-                           krumm_aig: TemplateLLM, li_aig: TemplateLLM) -> tuple:
-    """Process all traits concurrently and return results."""
-    krumm_sjt = {}
-    li_sjt = {}
+                           krumm_aig: AsyncTemplateLLM, li_aig: AsyncTemplateLLM) -> tuple:
+    """Process all traits concurrently and return results.
+
+    Each trait is appended to ``*.jsonl`` checkpoints as soon as it finishes,
+    so a crash keeps the completed traits; the returned dicts are merged
+    back from those files. A rerun resumes from the checkpoints and only
+    generates what they are missing; delete them to start over.
+    """
+    os.makedirs(RESULT_DIR, exist_ok=True)
+    krumm_part = op.join(RESULT_DIR, f'KrummSJT_{LANGUAGE}.jsonl')
+    li_part = op.join(RESULT_DIR, f'LiSJT_{LANGUAGE}.jsonl')
+    krumm_todo = [trait for trait in TRAITS if trait not in read_jsonl(krumm_part)]
+    li_todo = [trait for trait in TRAITS if trait not in read_jsonl(li_part)]
+    if len(krumm_todo) < len(TRAITS) or len(li_todo) < len(TRAITS):
+        tqdm.write(f"Resuming from checkpoints: {len(krumm_todo)} Krumm and "
+                   f"{len(li_todo)} Li traits left")
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT)
     
-    # Create progress bar for traits
-    with tqdm(total=len(TRAITS), desc="Processing traits") as pbar:
-        # Process all traits concurrently
-        tasks = [
-            generate_trait_sjts(trait, pbar, mussel_sjt, trait_def, krumm_aig, li_aig) 
-            for trait in TRAITS
-        ]
-        results = await asyncio.gather(*tasks)
-        
-    # Collect results
-    for trait_name, krumm_result, li_result in results:
-        krumm_sjt.update(krumm_result)
-        li_sjt.update(li_result)
+    li_job = None
+    if li_todo and USE_BATCH:
+        # Li requests are independent: run them as one batch job while Krumm chains go online
+        li_job = asyncio.create_task(asyncio.to_thread(
+            generate_li_batch, LiGenerator(li_aig, semaphore), mussel_sjt, trait_def, li_todo
+        ))
+    elif li_todo and LI_COMBINED:
+        li_job = asyncio.create_task(LiGenerator(li_aig, semaphore).generate_batch(
+            li_todo, trait_def, mussel_sjt, N_ITEMS, model=MODEL
+        ))
+
+    # Process the remaining traits concurrently; the bar advances as each trait completes
+    per_trait_li = [] if USE_BATCH or LI_COMBINED else li_todo
+    pending = [trait for trait in TRAITS if trait in krumm_todo or trait in per_trait_li]
+    tasks = [
+        generate_trait_sjts(trait, mussel_sjt, trait_def, krumm_aig, li_aig, semaphore,
+                            run_li=trait in per_trait_li, run_krumm=trait in krumm_todo)
+        for trait in pending
+    ]
+    for fut in tqdm.as_completed(tasks, total=len(pending), desc="Processing traits"):
+        trait_name, krumm_result, li_result = await fut
+        if krumm_result:
+            append_jsonl(krumm_part, krumm_result)
+        if li_result:
+            append_jsonl(li_part, li_result)
 
-    return krumm_sjt, li_sjt
+    if li_job is not None:
+        for trait, sjts in (await li_job).items():
+            append_jsonl(li_part, {trait: sjts})
+
+    return merge_jsonl(krumm_part), merge_jsonl(li_part)
     
-def filter_sjt_keys(sjt_dict: dict[str, Any]) -> dict[str, Any]:
-    """Extract only situation and options from SJT items."""
-    filtered = {}
-    for trait, items in sjt_dict.items():
-        filtered[trait] = {}
-        for idx, item in items.items():
-            filtered[trait][idx] = {
-                "situation": item["situation"],
-                "options": item["options"]
-            }
-    return filtered
+def filter_sjt_keys(sjt_dict: dict[str, Any], rename: Optional[dict[str, str]] = None) -> dict[str, Any]:
+    """Extract only situation and options from SJT items, optionally renaming traits."""
+    rename = rename or {}
+    return {
+        rename.get(trait, trait): {
+            idx: {"situation": item["situation"], "options": item["options"]}
+            for idx, item in items.items()
+        }
+        for trait, items in sjt_dict.items()
+    }
 
 
 def save_results(krumm_sjt: dict, li_sjt: dict) -> None:
-    """Save SJT results to JSON files."""
+    """Filter SJT results and save them to JSON files under their short trait keys."""
     os.makedirs(RESULT_DIR, exist_ok=True)
-    krumm_sjt_ = {k.split('-')[0]: v for k, v in krumm_sjt.items()}
-    li_sjt_ = {k.split('-')[0]: v for k, v in li_sjt.items()}
-    with open(op.join(RESULT_DIR, f'KrummSJT_{LANGUAGE}.json'), 'w') as f:
-        json.dump(krumm_sjt_, f, indent=4, ensure_ascii=False)
-
-    with open(op.join(RESULT_DIR, f'LiSJT_{LANGUAGE}.json'), 'w') as f:
-        json.dump(li_sjt_, f, indent=4, ensure_ascii=False)
+    dump_json(filter_sjt_keys(krumm_sjt, TRAIT_KEYS), op.join(RESULT_DIR, f'KrummSJT_{LANGUAGE}.json'), indent=True)
+    dump_json(filter_sjt_keys(li_sjt, TRAIT_KEYS), op.join(RESULT_DIR, f'LiSJT_{LANGUAGE}.json'), indent=True)
 
 def main() -> None:
     """Main execution function."""
@@ -229,8 +438,6 @@ def main() -> None:
     )
     
     # Filter and save results
-    krumm_sjt = filter_sjt_keys(krumm_sjt)
-    li_sjt = filter_sjt_keys(li_sjt)
     save_results(krumm_sjt, li_sjt)
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+import json
+import time
+from typing import Any, Optional
+
+from openai import OpenAI
+
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchRunner:
+    """Run independent chat-completion requests through the OpenAI Batch API.
+
+    The requests are uploaded as one JSONL file, the batch is polled until
+    it reaches a terminal state, and the output file is read back and
+    matched to the requests by ``custom_id``.
+
+    Parameters
+    ----------
+    client : OpenAI, optional
+        Synchronous client; defaults to ``OpenAI()`` configured from the environment.
+    poll_interval : float, optional
+        Seconds between status checks.
+    completion_window : str, optional
+        Batch completion window accepted by the API.
+    show_progress : bool, optional
+        Print the batch status at each poll.
+    """
+
+    def __init__(
+        self,
+        client: Optional[OpenAI] = None,
+        poll_interval: float = 30.0,
+        completion_window: str = "24h",
+        show_progress: bool = True,
+    ):
+        self.client = client or OpenAI()
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.show_progress = show_progress
+
+    def submit(self, requests: dict[str, dict[str, Any]]) -> str:
+        """Upload ``{custom_id: request_body}`` and create the batch; returns the batch id."""
+        payload = "\n".join(
+            json.dumps(
+                {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body},
+                ensure_ascii=False,
+            )
+            for custom_id, body in requests.items()
+        )
+        input_file = self.client.files.create(
+            file=("batch_requests.jsonl", payload.encode("utf-8")),
+            purpose="batch",
+        )
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window,
+        )
+        if self.show_progress:
+            print(f"📦 Submitted batch {batch.id} with {len(requests)} requests")
+        return batch.id
+
+    def wait(self, batch_id: str):
+        """Poll until the batch reaches a terminal status and return it."""
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if self.show_progress and batch.request_counts is not None:
+                counts = batch.request_counts
+                print(f"⏳ Batch {batch_id}: {batch.status} "
+                      f"({counts.completed}/{counts.total}, failed {counts.failed})")
+            if batch.status in TERMINAL_STATUSES:
+                return batch
+            time.sleep(self.poll_interval)
+
+    def results(self, batch) -> dict[str, dict[str, Any]]:
+        """Return ``{custom_id: response_body}`` for the requests that succeeded."""
+        if batch.status != "completed" or batch.output_file_id is None:
+            raise RuntimeError(f"Batch {batch.id} did not complete: {batch.status}")
+
+        bodies = {}
+        for line in self.client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            body = (record.get("response") or {}).get("body") or {}
+            if record.get("error") or "choices" not in body:
+                continue
+            bodies[record["custom_id"]] = body
+        return bodies
+
+    def run(self, requests: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+        """Submit, wait and collect in one call."""
+        return self.results(self.wait(self.submit(requests)))
+
+    @staticmethod
+    def content(body: dict[str, Any]) -> str:
+        """Message text of a chat-completion response body."""
+        return body["choices"][0]["message"]["content"]
@@ -1,10 +1,16 @@
 import json
 import logging
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, Optional
 
 import pandas as pd
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib parser
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 class DatasetConfig:
@@ -79,6 +85,36 @@ class LanguageNotSupportedError(DatasetError):
     """Raised when language is not supported for a dataset."""
     pass
 
+def _read_json(file_path: Path) -> dict[str, Any]:
+    """Load JSON file with proper error handling."""
+    if not file_path.exists():
+        raise FileNotFoundError(f"Dataset file not found: {file_path}")
+    
+    try:
+        if orjson is not None:
+            with open(file_path, "rb") as f:
+                data = orjson.loads(f.read())
+        else:
+            with open(file_path, encoding="utf-8") as f:
+                data = json.load(f)
+        logger.debug(f"Successfully loaded data from {file_path}")
+        return data
+    except json.JSONDecodeError as e:
+        raise DatasetError(f"Invalid JSON format in {file_path}: {e}")
+    except UnicodeDecodeError as e:
+        raise DatasetError(f"Encoding error reading {file_path}: {e}")
+    except Exception as e:
+        raise DatasetError(f"Unexpected error loading {file_path}: {e}")
+
+# Process-wide LRU keyed by file path: every DataLoader in the interpreter
+# shares one parsed object per dataset. It is handed out as is (copying costs
+# more than re-parsing), so cached results are read-only.
+_read_json_memo = lru_cache(maxsize=32)(_read_json)
+
+def _read_json_cached(file_path: Path) -> dict[str, Any]:
+    """Cached ``_read_json``; the returned object is shared and must not be mutated."""
+    return _read_json_memo(file_path)
+
 class DataLoader:
     """Robust data loader for psychological assessment datasets."""
     
@@ -89,7 +125,6 @@ class DataLoader:
             config: Custom dataset configuration. If None, uses default config.
         """
         self.config = config or DatasetConfig()
-        self._cache = {}
     
     @property
     def available_datasets(self) -> dict[str, dict[str, Path]]:
@@ -125,22 +160,11 @@ class DataLoader:
         except (ValueError, FileNotFoundError):
             return False
     
-    def _load_json_file(self, file_path: Path) -> dict[str, Any]:
-        """Load JSON file with proper error handling."""
-        if not file_path.exists():
-            raise FileNotFoundError(f"Dataset file not found: {file_path}")
-        
-        try:
-            with open(file_path, encoding="utf-8") as f:
-                data = json.load(f)
-            logger.debug(f"Successfully loaded data from {file_path}")
-            return data
-        except json.JSONDecodeError as e:
-            raise DatasetError(f"Invalid JSON format in {file_path}: {e}")
-        except UnicodeDecodeError as e:
-            raise DatasetError(f"Encoding error reading {file_path}: {e}")
-        except Exception as e:
-            raise DatasetError(f"Unexpected error loading {file_path}: {e}")
+    def _load_json_file(self, file_path: Path, use_cache: bool = True) -> dict[str, Any]:
+        """Load JSON file, sharing the parsed result process-wide if requested."""
+        if use_cache:
+            return _read_json_cached(file_path)
+        return _read_json(file_path)
     
     def load(
         self, 
@@ -153,7 +177,9 @@ class DataLoader:
         Args:
             dataset_name: Name of the dataset to load
             language: Language variant ("en" or "zh")
-            use_cache: Whether to use cached data if available
+            use_cache: Whether to use the process-wide cached data if available.
+                Cached data is shared and must be treated as read-only; pass
+                False to get a private copy you can modify.
             
         Returns:
             Loaded dataset as dictionary
@@ -170,26 +196,12 @@ class DataLoader:
         if language not in ["en", "zh"]:
             raise LanguageNotSupportedError(f"Language '{language}' not supported. Use 'en' or 'zh'")
         
-        cache_key = f"{dataset_name}_{language}"
-        
-        # Return cached data if available and requested
-        if use_cache and cache_key in self._cache:
-            logger.debug(f"Returning cached data for {cache_key}")
-            return self._cache[cache_key]
-        
         try:
             file_path = self.config.get_dataset_path(dataset_name, language)
             if file_path.suffix == ".py":
                 return str(file_path)
             
-            data = self._load_json_file(file_path)
-            
-            # Cache the loaded data
-            if use_cache:
-                self._cache[cache_key] = data
-                logger.debug(f"Cached data for {cache_key}")
-            
-            return data
+            return self._load_json_file(file_path, use_cache=use_cache)
             
         except ValueError as e:
             if "Dataset" in str(e) and "not found" in str(e):
@@ -204,7 +216,8 @@ class DataLoader:
         
         Args:
             dataset_name: Name of the dataset
-            use_cache: Whether to use cached metadata if available
+            use_cache: Whether to use the process-wide cached metadata if available.
+                Cached metadata is shared and must be treated as read-only.
             
         Returns:
             Dataset metadata as dictionary
@@ -216,30 +229,16 @@ class DataLoader:
         if not isinstance(dataset_name, str) or not dataset_name.strip():
             raise ValueError("dataset_name must be a non-empty string")
         
-        cache_key = f"{dataset_name}_meta"
-        
-        # Return cached metadata if available and requested
-        if use_cache and cache_key in self._cache:
-            logger.debug(f"Returning cached metadata for {dataset_name}")
-            return self._cache[cache_key]
-        
         try:
             meta_path = self.config.get_meta_path(dataset_name)
-            metadata = self._load_json_file(meta_path)
-            
-            # Cache the loaded metadata
-            if use_cache:
-                self._cache[cache_key] = metadata
-                logger.debug(f"Cached metadata for {dataset_name}")
-            
-            return metadata
+            return self._load_json_file(meta_path, use_cache=use_cache)
             
         except ValueError as e:
             raise DatasetNotFoundError(str(e))
     
     def clear_cache(self) -> None:
-        """Clear all cached data."""
-        self._cache.clear()
+        """Clear all cached data (shared by every DataLoader in the process)."""
+        _read_json_memo.cache_clear()
         logger.info("Cache cleared")
     
     def get_dataset_info(self, dataset_name: str) -> dict[str, Any]:
@@ -1,3 +1,9 @@
+import io
+import os
+import os.path as op
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 from .aig_eval import (
     PsychologicalTestEvaluator,
     EvaluationConfig,
@@ -5,9 +11,17 @@ from .aig_eval import (
     DimensionManager,
 )
 from .item_eval import PsychologicalItemEvaluator
+from ..utils.io import dump_json
+
 
+def _save_figure(fig, path, dpi):
+    """Render ``fig`` as PNG in memory and write it to ``path`` in one call."""
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=dpi, bbox_inches='tight', transparent=True)
+    Path(path).write_bytes(buf.getvalue())
 
-def save_evaluation_results(results, figures, results_dir):
+
+def save_evaluation_results(results, figures, results_dir, pretty=False, dpi=300):
     """
     Save evaluation results to files.
 
@@ -15,36 +29,33 @@ def save_evaluation_results(results, figures, results_dir):
         results: Dictionary containing evaluation results
         figures: Dictionary containing matplotlib figures
         results_dir: Base directory to save results
+        pretty: Also write indented ``*.pretty.json`` copies of the JSON files
+        dpi: Resolution of the saved figures (lower it for quick diagnostic runs)
     """
-    import os
-    import os.path as op
-    import json
-    detailed_result = op.join(results_dir, 'detailed')
-    os.makedirs(results_dir, exist_ok=True)
-    os.makedirs(detailed_result, exist_ok=True)
-
-    # Save trait-specific results as CSV
-    for trait in results['results']:
-        df = results['results'][trait]
-        df.to_csv(op.join(detailed_result, f'{trait}_eval.csv'), index=False)
-
-    # Save win rates as JSON
     detailed_result = op.join(results_dir, 'detailed')
-    os.makedirs(results_dir, exist_ok=True)
     os.makedirs(detailed_result, exist_ok=True)
-    
-    # Save trait-specific results as CSV
-    for trait in results['results']:
-        df = results['results'][trait]
-        df.to_csv(op.join(detailed_result, f'{trait}_eval.csv'), index=False)
-
-    # Save win rates as JSON
-    with open(op.join(detailed_result, 'win_rates.json'), 'w', encoding='utf-8') as f:
-        json.dump(results['win_rates'], f, ensure_ascii=False, indent=4)
 
-    with open(op.join(results_dir, 'overall_win_rates.json'), 'w', encoding='utf-8') as f:
-        json.dump(results['overall_win_rates'], f, ensure_ascii=False, indent=4)
+    # Save trait-specific results as CSV (independent files, written concurrently)
+    trait_results = results['results']
+    if trait_results:
+        with ThreadPoolExecutor(max_workers=min(8, len(trait_results))) as pool:
+            futures = [
+                pool.submit(df.to_csv, op.join(detailed_result, f'{trait}_eval.csv'), index=False)
+                for trait, df in trait_results.items()
+            ]
+        for future in futures:
+            future.result()
+
+    # Save win rates as compact JSON
+    json_files = [
+        (results['win_rates'], op.join(detailed_result, 'win_rates.json')),
+        (results['overall_win_rates'], op.join(results_dir, 'overall_win_rates.json')),
+    ]
+    for obj, path in json_files:
+        dump_json(obj, path)
+        if pretty:
+            dump_json(obj, op.splitext(path)[0] + '.pretty.json', indent=True)
 
     # Save figures
-    figures['multi_trait'].savefig(op.join(results_dir, 'multi_trait_eval.png'), dpi=300, bbox_inches='tight', transparent=True)
-    figures['overall'].savefig(op.join(results_dir, 'overall_eval.png'), dpi=300, bbox_inches='tight', transparent=True)
\ No newline at end of file
+    _save_figure(figures['multi_trait'], op.join(results_dir, 'multi_trait_eval.png'), dpi)
+    _save_figure(figures['overall'], op.join(results_dir, 'overall_eval.png'), dpi)
\ No newline at end of file
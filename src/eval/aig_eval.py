@@ -1,15 +1,28 @@
 # %%
 import json
 import logging
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any
 from dataclasses import dataclass
+from functools import lru_cache
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.figure import Figure
 from .item_eval import PsychologicalItemEvaluator, CostConfig
+from ..utils.io import dump_json
 import re
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib parser
+    orjson = None
+
+# Files at least this large are parsed from a memory map instead of a read() copy
+MMAP_THRESHOLD = 1 << 20
 # %%
 @dataclass
 class EvaluationConfig:
@@ -20,34 +33,47 @@ class EvaluationConfig:
     batch_size: int = 3000
     max_concurrent: int = 1000
     show_progress: bool = True
+    # Opt-in: runs each trait in its own thread (and event loop), splitting max_concurrent
+    # between them. Off by default; traits then run one after another with the full budget.
+    parallel_traits: bool = False
+    pairs_per_call: int = 1
+    use_json_schema: bool = True
+    execution_mode: str = "asyncio"  # or "process_pool" for local servers (see evaluate_test_items)
+    n_workers: Optional[int] = None
+    use_batch_api: bool = False  # evaluate offline through the Batch API (one pair per request)
+
+# (name, description) of each evaluation dimension; {trait} is filled in per trait
+_DIMENSION_TEMPLATES = (
+    ("NecessityOfTheSituation",
+     "对比题目 A 与题目 B，选择哪一个情境更不可或缺、更能准确反映{trait}的人格特质"),
+    ("RationalityOfOptions",
+     "对比题目 A 与题目 B，在选项的现实性与情境相关性方面，哪一个更符合生活情境、更具合理性"),
+    ("RationalityOfScoring",
+     "高{trait}水平为选项A与B，低{trait}水平为选项C与D，对比题目 A 与题目 B，哪一个更准确合理"),
+    ("OverallItemQuality",
+     "对比题目 A 与题目 B，在语法准确度，测量{trait}的情境丰富度、心理真实性及评分方式等方面，哪一个整体更优"),
+)
 
 class DimensionManager:
     """Manages evaluation dimensions for psychological traits"""
     
     @staticmethod
-    def get_dimensions(traits: list[str]) -> list[dict[str, str]]:
-        """Generate evaluation dimensions for a given trait"""
-        dimensions = {
-            trait: [
-            {
-                "name": 'NecessityOfTheSituation',
-                "description": f"对比题目 A 与题目 B，选择哪一个情境更不可或缺、更能准确反映{trait}的人格特质"
-            },
-            {
-                "name": "RationalityOfOptions", 
-                "description": f"对比题目 A 与题目 B，在选项的现实性与情境相关性方面，哪一个更符合生活情境、更具合理性"
-            },
-            {
-                "name": "RationalityOfScoring",
-                "description": f"高{trait}水平为选项A与B，低{trait}水平为选项C与D，对比题目 A 与题目 B，哪一个更准确合理"
-            },
-            {
-                "name": "OverallItemQuality",
-                "description": f"对比题目 A 与题目 B，在语法准确度，测量{trait}的情境丰富度、心理真实性及评分方式等方面，哪一个整体更优"
-            }
-        ] for trait in traits
+    def get_dimensions(traits: list[str]) -> dict[str, list[dict[str, str]]]:
+        """Generate evaluation dimensions for the given traits"""
+        # fresh dicts per call, so callers may modify the result without touching the cache
+        return {
+            trait: [dict(dim) for dim in DimensionManager._trait_dimensions(trait)]
+            for trait in traits
         }
-        return dimensions
+    
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _trait_dimensions(trait: str) -> tuple[dict[str, str], ...]:
+        """Dimensions of one trait, formatted once per trait"""
+        return tuple(
+            {"name": name, "description": description.format(trait=trait)}
+            for name, description in _DIMENSION_TEMPLATES
+        )
 
 class DataLoader:
     """Handles loading and preprocessing of psychological test data"""
@@ -56,17 +82,28 @@ class DataLoader:
         self.data_paths = data_paths
         self.logger = logging.getLogger(__name__)
         
-    def load_json_data(self, filepath: str) -> dict:
-        """Load JSON data with error handling"""
+    def load_json_data(self, filepath: str, keys: Optional[list[str]] = None) -> dict:
+        """Load JSON data with error handling, keeping only the top-level ``keys`` if given"""
         try:
-            with open(filepath, encoding='utf-8') as f:
-                return json.load(f)
+            if orjson is not None:
+                with open(filepath, 'rb') as f:
+                    if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+                        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as buf:
+                            data = orjson.loads(buf)
+                    else:
+                        data = orjson.loads(f.read())
+            else:
+                with open(filepath, encoding='utf-8') as f:
+                    data = json.load(f)
         except FileNotFoundError:
             self.logger.error(f"File not found: {filepath}")
             raise
         except json.JSONDecodeError:
             self.logger.error(f"Invalid JSON in file: {filepath}")
             raise
+        if keys is None:
+            return data
+        return {key: data[key] for key in keys if key in data}
     
     def load_all_datasets(
         self, 
@@ -83,7 +120,7 @@ class DataLoader:
             
             # Load raw data
             try:
-                raw_data = self.load_json_data(self.data_paths[aig])
+                raw_data = self.load_json_data(self.data_paths[aig], keys=traits)
             except Exception as e:
                 self.logger.error(f"Failed to load data for {aig}: {e}")
                 continue
@@ -98,17 +135,38 @@ class DataLoader:
     
     def _flatten_datasets(self, datasets: dict) -> dict:
         """Flatten nested dataset structure for evaluation"""
-        flattened = {}
-        for trait, tests in datasets.items():
-            flattened[trait] = {}
-            for test_name, test_data in tests.items():
-                for idx, item in test_data.items():
-                    flattened[trait][f'{test_name}_{idx}'] = item
-        return flattened
+        return {
+            trait: {
+                f'{test_name}_{idx}': item
+                for test_name, test_data in tests.items()
+                for idx, item in test_data.items()
+            }
+            for trait, tests in datasets.items()
+        }
     
 class WinRateCalculator:
     """Calculates win rates for different test types across dimensions"""
     
+    @staticmethod
+    def _prepare(df: pd.DataFrame, test_types: Optional[list[str]] = None) -> pd.DataFrame:
+        """Return ``df`` with the test type of items A and B as ``_typeA``/``_typeB`` columns.
+
+        The columns are categoricals (over ``test_types`` if given; other types
+        become NaN), so comparisons and counts run on integer codes. A frame that
+        already has them is returned as is, so a prepared frame (or slices of it)
+        can be passed repeatedly without re-splitting the ids. The input is not
+        modified, keeping the columns out of the saved result CSVs.
+        """
+        if {'_typeA', '_typeB'}.issubset(df.columns):
+            return df
+        type_A = df['A'].str.split('_', n=1).str[0]
+        type_B = df['B'].str.split('_', n=1).str[0]
+        if test_types is None:
+            test_types = pd.unique(pd.concat([type_A, type_B]).dropna())
+        # one dtype for both columns, so they can be combined with where()
+        dtype = pd.CategoricalDtype(test_types)
+        return df.assign(_typeA=type_A.astype(dtype), _typeB=type_B.astype(dtype))
+    
     @staticmethod
     def calculate_win_rates(
         df: pd.DataFrame, 
@@ -116,34 +174,22 @@ class WinRateCalculator:
         test_types: Optional[list[str]] = None
         ) -> dict[str, dict[str, float]]:
         """Calculate win rates for each test type and dimension"""
-        win_rates = {}
         if test_types is None:
             raise ValueError("test_types must be provided")
         
         if dimensions is None:
             dimensions = df['dimension'].unique()
         
-        for dim in dimensions:
-            win_rates[dim] = {}
-            for test_type in test_types:
-                wins = 0
-                total = 0
-                
-                for _, row in df.iterrows():
-                    if row['dimension'] != dim:
-                        continue
-                        
-                    type_A = row['A'].split('_')[0]
-                    type_B = row['B'].split('_')[0]
-
-                    total += 1
-                    if ((row['winner'] == 'A' and type_A == test_type) or 
-                        (row['winner'] == 'B' and type_B == test_type)):
-                        wins += 1
-                
-                win_rates[dim][test_type] = wins / total if total > 0 else 0
-        
-        return win_rates
+        df = WinRateCalculator._prepare(df, test_types)
+        # Test type of the winning item; NaN when the winner is neither 'A' nor 'B'
+        winner_type = df['_typeA'].where(df['winner'] == 'A', df['_typeB'].where(df['winner'] == 'B'))
+        
+        wins = pd.crosstab(df['dimension'], winner_type).reindex(
+            index=dimensions, columns=test_types, fill_value=0
+        )
+        totals = df['dimension'].value_counts().reindex(dimensions, fill_value=0)
+        win_rates = wins.div(totals.where(totals > 0), axis=0).fillna(0.0)
+        return win_rates.to_dict(orient='index')
     
     @staticmethod
     def calculate_overall_win_rates(
@@ -153,30 +199,47 @@ class WinRateCalculator:
         dimensions: Optional[list[str]] = None,
         ) -> dict[str, dict[str, float]]:
         """Calculate overall win rates across all traits"""
-        overall_win_rates = {}
         if test_types is None:
             raise ValueError("test_types must be provided")
 
         if dimensions is None:
-            all_dimensions = set()
-            for trait_win_rates in win_rates_by_trait.values():
-                all_dimensions.update(trait_win_rates.keys())
-            dimensions = list(all_dimensions)
-        
-        for dim in dimensions:
-            overall_win_rates[dim] = {}
-            for test_type in test_types:
-                total_rate = 0
-                count = 0
-                for trait in traits:
-                    if (dim in win_rates_by_trait[trait] and 
-                        test_type in win_rates_by_trait[trait][dim]):
-                        total_rate += win_rates_by_trait[trait][dim][test_type]
-                        count += 1
-                overall_win_rates[dim][test_type] = total_rate / count if count > 0 else 0
-        
-        return overall_win_rates
+            dimensions = list(dict.fromkeys(
+                dim for trait_win_rates in win_rates_by_trait.values() for dim in trait_win_rates
+            ))
+        
+        # Long form (dimension, test_type, rate) over the selected traits; a mean
+        # only covers the traits that have that dimension/test type
+        records = [
+            (dim, test_type, rate)
+            for trait in traits
+            for dim, rates in win_rates_by_trait[trait].items()
+            for test_type, rate in rates.items()
+        ]
+        if not records:
+            return {dim: {test_type: 0 for test_type in test_types} for dim in dimensions}
+        
+        long = pd.DataFrame.from_records(records, columns=['dimension', 'test_type', 'rate'])
+        means = long.groupby(['dimension', 'test_type'])['rate'].mean().unstack()
+        overall_win_rates = means.reindex(index=dimensions, columns=test_types).fillna(0.0)
+        return overall_win_rates.to_dict(orient='index')
     
+# rcParams are process-global: configure them once, not per visualizer
+_RC_CONFIGURED = False
+# Position before each inner capital of a CamelCase dimension name
+_CAMEL_RE = re.compile(r'(?<!^)([A-Z])')
+
+@lru_cache(maxsize=None)
+def _radar_angles(n_dims: int) -> tuple[float, ...]:
+    """Axis angles for ``n_dims`` dimensions, with the first repeated to close the polygon"""
+    angles = np.linspace(0, 2 * np.pi, n_dims, endpoint=False).tolist()
+    return tuple(angles + angles[:1])
+
+@lru_cache(maxsize=None)
+def _dimension_labels(dimensions: tuple[str, ...]) -> tuple[str, ...]:
+    """Format dimension labels for better readability"""
+    # 自动识别驼峰命名并在大写字母前添加换行
+    return tuple(_CAMEL_RE.sub(r'\n\1', d) for d in dimensions)
+
 class RadarChartVisualizer:
     """Creates elegant radar charts for psychological test evaluation results"""
 
@@ -187,6 +250,10 @@ class RadarChartVisualizer:
 
     def setup_matplotlib(self):
         """Configure matplotlib for better visualization"""
+        global _RC_CONFIGURED
+        if _RC_CONFIGURED:
+            return
+        _RC_CONFIGURED = True
         plt.rcParams['font.sans-serif'] = ['Times New Roman', 'Songti SC', 'DejaVu Sans']
         plt.rcParams['axes.unicode_minus'] = False
         plt.rcParams['figure.dpi'] = 100
@@ -197,17 +264,14 @@ class RadarChartVisualizer:
                                figsize: tuple[int, int] = (20, 4),
                                save_path: Optional[str] = None) -> Figure:
         """Create radar charts for multiple traits"""
-        fig, axes = plt.subplots(1, len(traits), figsize=figsize, 
-                               subplot_kw=dict(projection='polar'))
-        
-        if len(traits) == 1:
-            axes = [axes]
+        # Fixed grid spacing instead of tight_layout(), which re-measures every axis
+        fig = plt.figure(figsize=figsize)
+        gs = fig.add_gridspec(1, len(traits), wspace=0.4)
+        axes = [fig.add_subplot(gs[0, i], projection='polar') for i in range(len(traits))]
         
         for idx, trait in enumerate(traits):
             self._plot_single_radar(axes[idx], win_rates[trait], trait, show_legend=(idx == 0))
         
-        plt.tight_layout()
-        
         if save_path:
             plt.savefig(save_path, bbox_inches='tight', facecolor='white')
         
@@ -220,8 +284,7 @@ class RadarChartVisualizer:
         fig, ax = plt.subplots(figsize=figsize, subplot_kw=dict(projection='polar'))
         
         dimensions = list(overall_win_rates.keys())
-        angles = np.linspace(0, 2 * np.pi, len(dimensions), endpoint=False).tolist()
-        angles += angles[:1]
+        angles = list(_radar_angles(len(dimensions)))
         
         for i, test_type in enumerate(self.test_types):
             values = [overall_win_rates[dimension][test_type] for dimension in dimensions]
@@ -229,7 +292,7 @@ class RadarChartVisualizer:
             
             ax.plot(angles, values, 'o-', linewidth=3, label=test_type, 
                    color=self.colors[i], markersize=8)
-            ax.fill(angles, values, alpha=0.2, color=self.colors[i])
+            ax.fill(angles, values, alpha=0.2, color=self.colors[i], rasterized=True)
         
         ax.set_xticks(angles[:-1])
         ax.set_xticklabels(self._format_dimension_labels(dimensions), fontsize=12)
@@ -250,8 +313,7 @@ class RadarChartVisualizer:
                           trait: str, show_legend: bool = False):
         """Plot radar chart for a single trait"""
         dimensions = list(trait_win_rates.keys())
-        angles = np.linspace(0, 2 * np.pi, len(dimensions), endpoint=False).tolist()
-        angles += angles[:1]
+        angles = list(_radar_angles(len(dimensions)))
         
         for i, test_type in enumerate(self.test_types):
             values = [trait_win_rates[dimension][test_type] for dimension in dimensions]
@@ -271,12 +333,7 @@ class RadarChartVisualizer:
     
     def _format_dimension_labels(self, dimensions: list[str]) -> list[str]:
         """Format dimension labels for better readability"""
-        formatted = []
-        for d in dimensions:
-            # 自动识别驼峰命名并在大写字母前添加换行
-            formatted_d = re.sub(r'(?<!^)([A-Z])', r'\n\1', d)
-            formatted.append(formatted_d)
-        return formatted
+        return list(_dimension_labels(tuple(dimensions)))
         
 class PsychologicalTestEvaluator:
     """Main class for psychological test evaluation with iterative analysis"""
@@ -319,21 +376,25 @@ class PsychologicalTestEvaluator:
         )
         
         # Run evaluations for each trait
-        results = {}
-        for trait in self.config.traits:
-            self.logger.info(f"Evaluating trait: {trait}")
-            self.evaluator = PsychologicalItemEvaluator(
-                cost_config=self.config.cost_config,
-                model_name=model
-            )
-
-            results[trait] = self.evaluator.evaluate_test_items(
-                self.datasets[trait],
-                self.dimensions[trait],
-                batch_size=self.config.batch_size,
-                max_concurrent=self.config.max_concurrent,
-                show_progress=self.config.show_progress
-            )
+        traits = self.config.traits
+        if self.config.parallel_traits and len(traits) > 1:
+            # Traits are independent; split the concurrency budget so the overall cap still holds
+            per_trait_concurrent = max(1, self.config.max_concurrent // len(traits))
+            # Evaluators keep per-trait parser state, so each concurrent trait gets its own
+            with ThreadPoolExecutor(max_workers=len(traits)) as pool:
+                futures = {
+                    trait: pool.submit(
+                        self._evaluate_trait, trait, self._make_evaluator(model), per_trait_concurrent
+                    )
+                    for trait in traits
+                }
+            results = {trait: future.result() for trait, future in futures.items()}
+        else:
+            evaluator = self._make_evaluator(model)
+            results = {
+                trait: self._evaluate_trait(trait, evaluator, self.config.max_concurrent)
+                for trait in traits
+            }
         
         # Calculate win rates
         win_rates = {
@@ -357,9 +418,40 @@ class PsychologicalTestEvaluator:
             'overall_win_rates': overall_win_rates
         }
     
+    def _make_evaluator(self, model: str) -> PsychologicalItemEvaluator:
+        """Create an item evaluator for ``model``"""
+        return PsychologicalItemEvaluator(
+            cost_config=self.config.cost_config,
+            model_name=model,
+            use_json_schema=self.config.use_json_schema
+        )
+    
+    def _evaluate_trait(self, trait: str, evaluator: PsychologicalItemEvaluator, 
+                        max_concurrent: int) -> pd.DataFrame:
+        """Evaluate all item pairs of one trait"""
+        self.logger.info(f"Evaluating trait: {trait}")
+        return evaluator.evaluate_test_items(
+            self.datasets[trait],
+            self.dimensions[trait],
+            batch_size=self.config.batch_size,
+            max_concurrent=max_concurrent,
+            show_progress=self.config.show_progress,
+            pairs_per_call=self.config.pairs_per_call,
+            execution_mode=self.config.execution_mode,
+            n_workers=self.config.n_workers,
+            use_batch_api=self.config.use_batch_api
+        )
+
     def create_visualizations(self, evaluation_results: dict[str, Any], 
-                            save_plots: bool = True, output_dir: str = "./plots") -> dict[str, Figure]:
-        """Create all visualization plots"""
+                            save_plots: bool = True, output_dir: str = "./plots",
+                            return_figures: bool = True) -> dict[str, Figure]:
+        """Create all visualization plots
+        
+        With ``return_figures=False`` the figures are closed after saving (and
+        nothing is rendered at all if ``save_plots`` is False too).
+        """
+        if not save_plots and not return_figures:
+            return {}
         if save_plots:
             Path(output_dir).mkdir(exist_ok=True)
         
@@ -380,11 +472,15 @@ class PsychologicalTestEvaluator:
             save_path=overall_path
         )
         
+        if not return_figures:
+            for fig in figures.values():
+                plt.close(fig)
+            return {}
         return figures
         
     def export_results(self, evaluation_results: dict[str, Any], 
-                      output_path: str = "./results.json"):
-        """Export evaluation results to JSON"""
+                      output_path: str = "./results.json", pretty: bool = False):
+        """Export evaluation results to compact JSON (plus an indented ``.pretty.json`` if ``pretty``)"""
         # Convert DataFrames to dictionaries for JSON serialization
         exportable_results = {
             'win_rates': evaluation_results['win_rates'],
@@ -396,8 +492,9 @@ class PsychologicalTestEvaluator:
             }
         }
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(exportable_results, f, indent=2, ensure_ascii=False)
+        dump_json(exportable_results, output_path)
+        if pretty:
+            dump_json(exportable_results, str(Path(output_path).with_suffix('.pretty.json')), indent=True)
         
         self.logger.info(f"Results exported to {output_path}")
     
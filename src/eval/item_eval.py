@@ -1,28 +1,47 @@
 import asyncio
 import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import pandas as pd
 from itertools import combinations
-from typing import Dict, List, Tuple, Any, Optional, Annotated
-from dataclasses import dataclass, asdict
+from typing import Dict, List, Tuple, Any, Optional, Annotated, Literal
+from dataclasses import dataclass, fields, replace
 from datetime import datetime
+from functools import lru_cache
 
 import os
 from tqdm import tqdm
 import operator
-import nest_asyncio
+import re
+import time
 import tiktoken
+from openai import APIStatusError
 
 from langgraph.graph import StateGraph, END
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import PromptTemplate
-from pydantic import BaseModel, Field, create_model
+from pydantic import BaseModel, ConfigDict, Field, create_model
 from typing_extensions import TypedDict
 from dotenv import load_dotenv
+
+from ..batch_runner import BatchRunner
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib parser
+    orjson = None
+
 load_dotenv()
 
-@dataclass
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+# orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，捕获方式不变
+_json_loads = orjson.loads if orjson is not None else json.loads
+_VALID_WINNERS = frozenset({'A', 'B'})
+# 进度条最短刷新间隔（秒）；高并发下逐次刷新会让终端输出成为瓶颈
+POSTFIX_INTERVAL = 0.25
+
+@dataclass(slots=True)
 class PairwiseEvaluation:
     """配对评估结果数据结构"""
     item1_id: str
@@ -31,7 +50,7 @@ class PairwiseEvaluation:
     winner: str
     evaluation_time: str
 
-@dataclass
+@dataclass(slots=True)
 class TokenUsage:
     """Token使用统计"""
     input_tokens: int = 0
@@ -44,17 +63,26 @@ class TokenUsage:
         self.output_tokens += output_tokens
         self.total_tokens += (input_tokens + output_tokens)
 
-@dataclass 
+@dataclass(slots=True)
 class CostConfig:
     """费用配置"""
     input_token_rate: float  # 输入token费率 (per 1M tokens)
     output_token_rate: float  # 输出token费率 (per 1M tokens)
+    batch_discount: float = 0.5  # Batch API 相对实时调用的费率系数
     
     def calculate_cost(self, token_usage: TokenUsage) -> float:
         """计算总费用"""
         input_cost = (token_usage.input_tokens / 1_000_000) * self.input_token_rate
         output_cost = (token_usage.output_tokens / 1_000_000) * self.output_token_rate
         return input_cost + output_cost
+    
+    def for_batch_api(self) -> "CostConfig":
+        """按 Batch API 折扣后的费率配置"""
+        return replace(
+            self,
+            input_token_rate=self.input_token_rate * self.batch_discount,
+            output_token_rate=self.output_token_rate * self.batch_discount
+        )
 
 class DimensionEvaluation(BaseModel):
     """单个维度评估结果的Pydantic模型，用于结构化输出"""
@@ -76,10 +104,14 @@ def create_dimension_model(dimensions: list[dict[str, str]]) -> type:
     fields = {}
     for dim in dimensions:
         field_name = dim['name']
-        fields[field_name] = (str, Field(..., description=f"Choose 'A' or 'B' for {dim['description']}"))
+        fields[field_name] = (Literal['A', 'B'], Field(..., description=f"Choose 'A' or 'B' for {dim['description']}"))
     
-    # 使用 pydantic.create_model 动态创建模型
-    DynamicDimensionModel = create_model('DynamicDimensionModel', **fields)
+    # 使用 pydantic.create_model 动态创建模型；禁止额外字段以满足严格JSON Schema的要求
+    DynamicDimensionModel = create_model(
+        'DynamicDimensionModel',
+        __config__=ConfigDict(extra='forbid'),
+        **fields
+    )
     
     return DynamicDimensionModel
 
@@ -91,8 +123,6 @@ class EvaluationState(TypedDict):
     # 处理过程数据 - 使用reducers避免并发更新冲突
     pairs_to_evaluate: Annotated[list[tuple[str, str, str]], operator.add]
     completed_evaluations: Annotated[list[PairwiseEvaluation], operator.add]
-    current_batch: list[tuple[str, str, str]]
-    batch_results: Annotated[list[PairwiseEvaluation], operator.add]
     
     # 输出数据
     final_results: Optional[pd.DataFrame]
@@ -100,6 +130,9 @@ class EvaluationState(TypedDict):
     # 配置
     batch_size: int
     max_concurrent: int
+    pairs_per_call: int
+    execution_mode: Literal['asyncio', 'process_pool']
+    n_workers: Optional[int]
     cost_config: Optional[CostConfig]
     
     # Token统计
@@ -120,19 +153,25 @@ class PsychologicalItemEvaluator:
         temperature: float = 0.3, 
         api_key: Optional[str] = None, 
         cost_config: Optional[CostConfig] = None,
-        sys_prompt: str = "你是一位心理测验专家，负责评估题目质量。"
+        sys_prompt: str = "你是一位心理测验专家，负责评估题目质量。",
+        use_json_schema: bool = True
     ) -> None:
+        """
+        Args:
+            use_json_schema: 通过 response_format=json_schema 在服务端约束输出格式；
+                不支持该参数的服务商设为False，改为在系统提示词中附加格式说明
+        """
         if api_key:
             os.environ["OPENAI_API_KEY"] = api_key
         elif not os.getenv("OPENAI_API_KEY"):
             raise ValueError("请设置OPENAI_API_KEY环境变量或在初始化时传入api_key参数")
         
         self.sys_prompt = sys_prompt
+        self.model_name = model_name
+        self.temperature = temperature
+        self.use_json_schema = use_json_schema
         
-        self.llm = ChatOpenAI(
-            model=model_name,
-            temperature=temperature
-        )
+        self.llm = self._make_llm()
         
         self.cost_config = cost_config or CostConfig(
             input_token_rate=0.8,
@@ -142,15 +181,55 @@ class PsychologicalItemEvaluator:
         # 初始化JSON解析器（将在评估时动态创建）
         self.json_parser = None
         self.dimension_model = None
+        self.structured_llm = None
+        # 配对数 -> (合并评估模型, JSON解析器, 结构化输出LLM)
+        self._marshaled_outputs: dict[int, tuple[type, JsonOutputParser, Any]] = {}
+        # id(options) -> (options, 序列化文本)；保留对象引用，避免id被复用
+        self._options_json: dict[int, tuple[Any, str]] = {}
+        # (dimensions, 维度说明, 输出示例)；同一组维度的提示词片段只构建一次
+        self._dimensions_prompt: Optional[tuple[Any, str, str]] = None
+        # 工作流结构固定，首次评估时编译一次后复用
+        self._compiled_workflow = None
         
         try:
             self.tokenizer = tiktoken.encoding_for_model("gpt-3.5-turbo")
         except KeyError:
             self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        # 系统提示词（含格式说明）每次调用都相同，缓存其token数，避免重复BPE编码
+        self._count_tokens_cached = lru_cache(maxsize=1024)(self._encode_length)
 
-    def count_tokens(self, text: str) -> int:
-        """计算文本的token数量"""
+    def _encode_length(self, text: str) -> int:
         return len(self.tokenizer.encode(text))
+
+    def _make_llm(self) -> ChatOpenAI:
+        return ChatOpenAI(
+            model=self.model_name,
+            temperature=self.temperature
+        )
+
+    def _run(self, coro):
+        """在新的事件循环中运行协程并返回结果；一次评估的所有请求共用这个循环，结束后关闭"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return self._run_and_close(coro)
+        # Jupyter等环境中当前线程已有运行中的循环，改在工作线程中驱动
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(self._run_and_close, coro).result()
+
+    def _run_and_close(self, coro):
+        try:
+            return asyncio.run(coro)
+        finally:
+            # LLM客户端的连接绑定在已关闭的循环上，下次评估换用新的客户端
+            self.llm = self._make_llm()
+            if self.dimension_model is not None:
+                self.structured_llm = self._structured_llm(self.dimension_model)
+            self._marshaled_outputs = {}
+
+    def count_tokens(self, text: str) -> int:
+        """计算文本的token数量（重复出现的文本只编码一次）"""
+        return self._count_tokens_cached(text)
     
     def setup_structured_output(self, dimensions: list[dict[str, str]]) -> None:
         """设置结构化输出解析器"""
@@ -158,6 +237,37 @@ class PsychologicalItemEvaluator:
         self.dimension_model = create_dimension_model(dimensions)
         # 创建JSON解析器
         self.json_parser = JsonOutputParser(pydantic_object=self.dimension_model)
+        self.structured_llm = self._structured_llm(self.dimension_model)
+        self._marshaled_outputs = {}
+    
+    def _structured_llm(self, model: type):
+        """绑定JSON Schema输出约束的LLM；include_raw保留原始响应以读取token用量和回退解析"""
+        if not self.use_json_schema:
+            return None
+        return self.llm.with_structured_output(model, method='json_schema', strict=True, include_raw=True)
+    
+    def _system_content(self, parser: JsonOutputParser) -> str:
+        """系统提示词；仅在未使用服务端JSON Schema约束时附加格式说明"""
+        if self.use_json_schema:
+            return self.sys_prompt
+        return f"{self.sys_prompt}\n\n{parser.get_format_instructions()}"
+    
+    async def _ainvoke_json(
+        self,
+        messages: list,
+        parser: JsonOutputParser,
+        structured_llm: Any = None
+    ) -> tuple[Any, Optional[dict[str, Any]]]:
+        """调用LLM并解析JSON，返回 (原始响应, 解析结果)；无法解析时解析结果为None"""
+        if structured_llm is not None:
+            output = await structured_llm.ainvoke(messages)
+            parsed = output['parsed']
+            return output['raw'], (parsed.model_dump() if parsed is not None else None)
+        response = await self.llm.ainvoke(messages)
+        try:
+            return response, parser.parse(response.content)
+        except Exception:
+            return response, None
     
     def estimate_cost_for_evaluation(
         self,
@@ -208,22 +318,13 @@ class PsychologicalItemEvaluator:
         workflow = StateGraph(EvaluationState)  # 使用定义的EvaluationState类
         
         workflow.add_node("generate_pairs", self.generate_pairs)
-        workflow.add_node("batch_evaluations", self.batch_evaluations)
-        workflow.add_node("process_batch", self.process_batch)
+        workflow.add_node("process_all_pairs", self.process_all_pairs)
         workflow.add_node("aggregate_results", self.aggregate_results)
         workflow.add_node("create_dataframe", self.create_dataframe)
         
         workflow.set_entry_point("generate_pairs")
-        workflow.add_edge("generate_pairs", "batch_evaluations")
-        workflow.add_conditional_edges(
-            "batch_evaluations",
-            self.should_continue_batching,
-            {
-                "continue": "process_batch",
-                "end": "aggregate_results"
-            }
-        )
-        workflow.add_edge("process_batch", "batch_evaluations")
+        workflow.add_edge("generate_pairs", "process_all_pairs")
+        workflow.add_edge("process_all_pairs", "aggregate_results")
         workflow.add_edge("aggregate_results", "create_dataframe")
         workflow.add_edge("create_dataframe", END)
         
@@ -231,18 +332,16 @@ class PsychologicalItemEvaluator:
     
     def generate_pairs(self, state: EvaluationState) -> dict[str, Any]:
         """生成所有需要评估的配对（每个配对评估所有维度）"""
-        pairs = []
         item_ids = list(state['test_items'].keys())
+        # 提取方法类型（假设ID格式为"method_index"），每个题目只拆分一次
+        item_types = [item_id.split('_', 1)[0] for item_id in item_ids]
         
-        # 只生成不同方法间的题目配对，每个配对将评估所有维度
-        for item1, item2 in combinations(item_ids, 2):
-            # 提取方法类型（假设ID格式为"method_index"）
-            item1_type = item1.split('_')[0]
-            item2_type = item2.split('_')[0]
-            
-            # 只添加不同方法间的配对
-            if item1_type != item2_type:
-                pairs.append((item1, item2, None))  # None表示评估所有维度
+        # 只生成不同方法间的题目配对，每个配对将评估所有维度（None表示评估所有维度）
+        pairs = [
+            (item_ids[i], item_ids[j], None)
+            for i, j in combinations(range(len(item_ids)), 2)
+            if item_types[i] != item_types[j]
+        ]
         
         # 初始化进度条
         progress_bar = None
@@ -251,6 +350,7 @@ class PsychologicalItemEvaluator:
                 total=len(pairs), 
                 desc="🔍 评估进度", 
                 unit="pair",
+                mininterval=POSTFIX_INTERVAL,
                 bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]"
             )
         
@@ -261,81 +361,259 @@ class PsychologicalItemEvaluator:
             'progress_bar': progress_bar
         }
     
-    def batch_evaluations(self, state: EvaluationState) -> dict[str, Any]:
-        """准备下一批评估"""
-        remaining_pairs = [
-            pair for pair in state['pairs_to_evaluate'] 
-            if not any(
-                eval.item1_id == pair[0] and eval.item2_id == pair[1]
-                for eval in state['completed_evaluations']
+    def process_all_pairs(self, state: EvaluationState) -> dict[str, Any]:
+        """在同一个事件循环中并发评估所有配对（同步版本）
+        
+        所有配对一次性提交，由信号量限制在途请求数；慢请求不会像分批处理那样
+        阻塞下一批的开始。``execution_mode='process_pool'`` 时配对分片到多个子进程。
+        """
+        pairs = [(item1_id, item2_id) for item1_id, item2_id, _ in state['pairs_to_evaluate']]
+        
+        if state.get('execution_mode') == 'process_pool':
+            evaluations, token_usage = self._evaluate_pairs_in_processes(pairs, state)
+        else:
+            evaluations, token_usage = self._run(self._evaluate_pairs_async(
+                pairs,
+                state['test_items'],
+                state['dimensions'],
+                state['max_concurrent'],
+                state.get('pairs_per_call', 1),
+                state.get('progress_bar')
+            ))
+        
+        # 汇总token使用统计
+        state['token_usage'].add(token_usage.input_tokens, token_usage.output_tokens)
+        
+        return {'completed_evaluations': evaluations}
+    
+    async def _evaluate_pairs_async(
+        self,
+        pairs: list[tuple[str, str]],
+        test_items: dict[str, dict[str, Any]],
+        dimensions: list[dict[str, str]],
+        max_concurrent: int,
+        pairs_per_call: int = 1,
+        progress_bar: Optional[tqdm] = None
+    ) -> tuple[list[PairwiseEvaluation], TokenUsage]:
+        """并发评估一组配对，返回评估结果与token用量"""
+        semaphore = asyncio.Semaphore(max_concurrent)
+        # 仅用于进度条显示的累计费用（增量累加）；返回的token统计在gather之后一次性汇总
+        running_cost = 0.0
+        last_postfix = 0.0
+        
+        async def evaluate_pairs_with_progress(chunk: list[tuple[str, str]]):
+            results, token_usage = await self.evaluate_pairs_marshaled_async(
+                chunk,
+                test_items,
+                dimensions,
+                semaphore
             )
+            
+            # 更新进度条
+            if progress_bar is not None:
+                nonlocal running_cost, last_postfix
+                running_cost += self.cost_config.calculate_cost(token_usage)
+                progress_bar.update(len(chunk))
+                # 显示当前评估的详细信息（限频，且不单独触发刷新）
+                now = time.monotonic()
+                if now - last_postfix >= POSTFIX_INTERVAL:
+                    last_postfix = now
+                    progress_bar.set_postfix({
+                        '题目': f"{chunk[-1][0]}-{chunk[-1][1]}",
+                        '维度数': len(results) // len(chunk),
+                        '费用': f"${running_cost:.4f}"
+                    }, refresh=False)
+            
+            return results, token_usage
+        
+        # 并行处理所有配对；pairs_per_call > 1 时每次调用评估一组配对
+        k = max(1, pairs_per_call)
+        tasks = [
+            evaluate_pairs_with_progress(pairs[i:i + k])
+            for i in range(0, len(pairs), k)
         ]
         
-        # 取下一批
-        current_batch = remaining_pairs[:state['batch_size']]
+        pair_results = await asyncio.gather(*tasks)
+        # 展平结果列表，并汇总token使用统计
+        evaluations = []
+        total_usage = TokenUsage()
+        for results, token_usage in pair_results:
+            evaluations.extend(results)
+            total_usage.add(token_usage.input_tokens, token_usage.output_tokens)
         
-        return {
-            'current_batch': current_batch,
-            'batch_results': []
+        return evaluations, total_usage
+    
+    def _evaluate_pairs_in_processes(
+        self,
+        pairs: list[tuple[str, str]],
+        state: EvaluationState
+    ) -> tuple[list[PairwiseEvaluation], TokenUsage]:
+        """将配对分片到多个子进程评估，每个进程有自己的事件循环和连接
+        
+        适用于本地推理服务（如Ollama）：服务端可并行处理多个请求
+        （OLLAMA_NUM_PARALLEL > 1）时，按进程分片可接近线性加速。
+        """
+        n_workers = max(1, min(state.get('n_workers') or os.cpu_count() or 1, len(pairs)))
+        shards = [pairs[i::n_workers] for i in range(n_workers)]
+        settings = {
+            'model_name': self.model_name,
+            'temperature': self.temperature,
+            'cost_config': self.cost_config,
+            'sys_prompt': self.sys_prompt,
+            'use_json_schema': self.use_json_schema
         }
+        # 总在途请求数与asyncio模式一致，平均分到各进程
+        max_concurrent = max(1, state['max_concurrent'] // n_workers)
+        
+        evaluations = []
+        token_usage = TokenUsage()
+        progress_bar = state.get('progress_bar')
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = {
+                pool.submit(
+                    _evaluate_pair_shard, settings, shard, state['test_items'], state['dimensions'],
+                    max_concurrent, state.get('pairs_per_call', 1)
+                ): len(shard)
+                for shard in shards
+            }
+            for future in as_completed(futures):
+                results, usage = future.result()
+                evaluations.extend(results)
+                token_usage.add(usage.input_tokens, usage.output_tokens)
+                if progress_bar is not None:
+                    progress_bar.update(futures[future])
+                    progress_bar.set_postfix({
+                        '费用': f"${self.cost_config.calculate_cost(token_usage):.4f}"
+                    })
+        
+        return evaluations, token_usage
     
-    def process_batch(self, state: EvaluationState) -> dict[str, Any]:
-        """处理当前批次的评估（同步版本）"""
+    async def evaluate_pairs_marshaled_async(
+        self,
+        pairs: list[tuple[str, str]],
+        test_items: dict[str, dict[str, Any]],
+        dimensions: list[dict[str, str]],
+        semaphore: asyncio.Semaphore
+    ) -> tuple[list[PairwiseEvaluation], TokenUsage]:
+        """在一次调用中评估多个配对的所有维度
         
-        async def async_batch_processing():
-            semaphore = asyncio.Semaphore(state['max_concurrent'])
-            
-            async def evaluate_pair_with_progress(item1_id: str, item2_id: str):
-                async with semaphore:
-                    results, token_usage = await self.evaluate_pair_all_dimensions_async(
-                        state['test_items'][item1_id],
-                        state['test_items'][item2_id],
-                        item1_id,
-                        item2_id,
-                        state['dimensions']
-                    )
-                    
-                    # 更新token使用统计
-                    state['token_usage'].add(token_usage.input_tokens, token_usage.output_tokens)
-                    
-                    # 更新进度条
-                    if state.get('progress_bar'):
-                        state['progress_bar'].update(1)
-                        # 显示当前评估的详细信息
-                        current_cost = state['cost_config'].calculate_cost(state['token_usage']) if state.get('cost_config') else 0
-                        state['progress_bar'].set_postfix({
-                            '题目': f"{item1_id}-{item2_id}",
-                            '维度数': len(results),
-                            '费用': f"${current_cost:.4f}"
-                        })
-                    
-                    return results
-            
-            # 并行处理当前批次
-            tasks = [
-                evaluate_pair_with_progress(item1_id, item2_id)
-                for item1_id, item2_id, _ in state['current_batch']
-            ]
-            
-            batch_results = await asyncio.gather(*tasks)
-            # 展平结果列表，因为每个任务现在返回多个评估结果
-            flattened_results = []
-            for results in batch_results:
-                flattened_results.extend(results)
-            
-            return flattened_results
+        响应缺失或不完整时将该组对半拆分重试，直至退回单配对评估。
+        """
+        if len(pairs) == 1:
+            item1_id, item2_id = pairs[0]
+            async with semaphore:
+                return await self.evaluate_pair_all_dimensions_async(
+                    test_items[item1_id], test_items[item2_id],
+                    item1_id, item2_id, dimensions
+                )
+        
+        system_content, prompt = self._build_marshaled_eval_messages(pairs, test_items, dimensions)
+        messages = [
+            SystemMessage(content=system_content),
+            HumanMessage(content=prompt)
+        ]
+        token_usage = TokenUsage()
         
-        # 检查是否在Jupyter环境中并处理事件循环
         try:
-            loop = asyncio.get_running_loop()
-            nest_asyncio.apply()
-            batch_results = asyncio.run(async_batch_processing())
-        except RuntimeError:
-            batch_results = asyncio.run(async_batch_processing())
+            _, parser, structured_llm = self._marshaled_outputs[len(pairs)]
+            async with semaphore:
+                response, response_dict = await self._ainvoke_json(messages, parser, structured_llm)
+            usage = self._token_usage(response, system_content, prompt)
+            token_usage.add(usage.input_tokens, usage.output_tokens)
+            if response_dict is None:
+                raise ValueError("合并评估响应无法解析")
+            
+            pair_results = []
+            for k in range(1, len(pairs) + 1):
+                pair_response = response_dict.get(f"pair_{k}")
+                results = self._valid_dimension_results(
+                    pair_response if isinstance(pair_response, dict) else {}, dimensions
+                )
+                if len(results) < len(dimensions):
+                    raise ValueError(f"pair_{k} 的维度结果不完整")
+                pair_results.append(results)
+        except Exception as e:
+            print(f"⚠️  {len(pairs)} 个配对的合并评估失败，拆分重试: {str(e)[:100]}")
+            if not token_usage.total_tokens:
+                # 调用本身失败：按本地计数记入输入token
+                token_usage.add(self.count_tokens(system_content) + self.count_tokens(prompt), 0)
+            half = len(pairs) // 2
+            (left, left_usage), (right, right_usage) = await asyncio.gather(
+                self.evaluate_pairs_marshaled_async(pairs[:half], test_items, dimensions, semaphore),
+                self.evaluate_pairs_marshaled_async(pairs[half:], test_items, dimensions, semaphore)
+            )
+            for usage in (left_usage, right_usage):
+                token_usage.add(usage.input_tokens, usage.output_tokens)
+            return left + right, token_usage
         
+        evaluation_time = datetime.now().isoformat()
+        evaluations = [
+            PairwiseEvaluation(
+                item1_id=item1_id,
+                item2_id=item2_id,
+                dimension=dimension_name,
+                winner=winner,
+                evaluation_time=evaluation_time
+            )
+            for (item1_id, item2_id), results in zip(pairs, pair_results)
+            for dimension_name, winner in results.items()
+        ]
+        return evaluations, token_usage
+    
+    def _token_usage(self, response, *input_texts: str) -> TokenUsage:
+        """优先使用接口返回的token用量，缺失时回退到本地tiktoken计数"""
+        usage = getattr(response, 'usage_metadata', None) or {}
+        input_tokens = usage.get('input_tokens')
+        if input_tokens is None:
+            input_tokens = sum(self.count_tokens(text) for text in input_texts)
+        output_tokens = usage.get('output_tokens')
+        if output_tokens is None:
+            output_tokens = self.count_tokens(response.content)
+        return TokenUsage(
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            total_tokens=input_tokens + output_tokens
+        )
+    
+    def _build_marshaled_eval_messages(
+        self,
+        pairs: list[tuple[str, str]],
+        test_items: dict[str, dict[str, Any]],
+        dimensions: list[dict[str, str]]
+    ) -> tuple[str, str]:
+        """构建多配对合并评估的 (system, user) 提示词"""
+        if self.json_parser is None or self.dimension_model is None:
+            self.setup_structured_output(dimensions)
+        if len(pairs) not in self._marshaled_outputs:
+            marshaled_model = create_model(
+                'MarshaledEvaluation',
+                __config__=ConfigDict(extra='forbid'),
+                **{
+                    f"pair_{k}": (self.dimension_model, Field(..., description=f"第{k}组配对的评估结果"))
+                    for k in range(1, len(pairs) + 1)
+                }
+            )
+            self._marshaled_outputs[len(pairs)] = (
+                marshaled_model,
+                JsonOutputParser(pydantic_object=marshaled_model),
+                self._structured_llm(marshaled_model)
+            )
+        prompt = self.create_marshaled_eval(
+            [(test_items[item1_id], test_items[item2_id]) for item1_id, item2_id in pairs],
+            dimensions
+        )
+        return self._system_content(self._marshaled_outputs[len(pairs)][1]), prompt
+    
+    def _valid_dimension_results(
+        self,
+        parsed: dict[str, Any],
+        dimensions: list[dict[str, str]]
+    ) -> dict[str, str]:
+        """保留取值为 "A"/"B" 的维度结果"""
         return {
-            'batch_results': batch_results,
-            'completed_evaluations': batch_results
+            dim['name']: winner
+            for dim in dimensions
+            if (winner := str(parsed.get(dim['name'], '')).upper()) in _VALID_WINNERS
         }
     
     async def evaluate_pair_all_dimensions_async(
@@ -348,51 +626,30 @@ class PsychologicalItemEvaluator:
     ) -> tuple[list[PairwiseEvaluation], TokenUsage]:
         """异步评估单个配对的所有维度，使用结构化输出"""
         
-        # 确保结构化输出解析器已设置
-        if self.json_parser is None or self.dimension_model is None:
-            self.setup_structured_output(dimensions)
-        
-        prompt = self.create_single_eval(
-            item1, item2, 
-            dimensions
-        )
-        
-        # 创建带有结构化输出指令的LLM链
-        format_instructions = self.json_parser.get_format_instructions()
-        
-        system_content = f"{self.sys_prompt}\n\n{format_instructions}"
+        # 创建带有结构化输出指令的提示词
+        system_content, prompt = self._build_eval_messages(item1, item2, dimensions)
         messages = [
             SystemMessage(content=system_content),
             HumanMessage(content=prompt)
         ]
         
-        # 计算输入token数量
-        input_tokens = self.count_tokens(system_content) + self.count_tokens(prompt)
-        
         try:
-            # 使用结构化输出链
-            chain = self.llm | self.json_parser
-            response_dict = await chain.ainvoke(messages)
-            response_content = json.dumps(response_dict, ensure_ascii=False)
-            
+            response, response_dict = await self._ainvoke_json(messages, self.json_parser, self.structured_llm)
         except Exception as e:
-            print(f"⚠️  结构化输出解析失败，使用回退方式: {str(e)[:100]}")
-            # 回退到原始方法
-            response = await self.llm.ainvoke(messages)
-            response_content = response.content
+            print(f"⚠️  调用失败，重试一次: {str(e)[:100]}")
+            response, response_dict = await self._ainvoke_json(messages, self.json_parser, self.structured_llm)
+        
+        if response_dict is not None:
+            response_dict = self._valid_dimension_results(response_dict, dimensions)
+        else:
+            print("⚠️  结构化输出解析失败，使用回退方式")
+            # 回退到宽松解析（复用同一响应，无需再次调用）
             response_dict = self._parse_multi_dimension_evaluation_response_fallback(
-                response_content, dimensions
+                response.content, dimensions
             )
         
-        # 计算输出token数量
-        output_tokens = self.count_tokens(response_content)
-        
         # 创建token使用统计
-        token_usage = TokenUsage(
-            input_tokens=input_tokens,
-            output_tokens=output_tokens,
-            total_tokens=input_tokens + output_tokens
-        )
+        token_usage = self._token_usage(response, system_content, prompt)
         
         # 创建多个PairwiseEvaluation对象
         evaluations = []
@@ -419,6 +676,120 @@ class PsychologicalItemEvaluator:
         
         return evaluations, token_usage
     
+    def _build_eval_messages(
+        self,
+        item1: dict[str, Any],
+        item2: dict[str, Any],
+        dimensions: list[dict[str, str]]
+    ) -> tuple[str, str]:
+        """构建评估用的 (system, user) 提示词"""
+        if self.json_parser is None or self.dimension_model is None:
+            self.setup_structured_output(dimensions)
+        prompt = self.create_single_eval(item1, item2, dimensions)
+        return self._system_content(self.json_parser), prompt
+
+    def evaluate_test_items_batch(
+        self,
+        test_items: dict[str, dict[str, Any]],
+        dimensions: list[dict[str, str]],
+        show_progress: bool = True,
+        poll_interval: float = 30.0
+    ) -> pd.DataFrame:
+        """通过 Batch API 离线评估所有配对（上传JSONL -> 轮询 -> 读取output_file）
+        
+        每个配对单独一个请求（不按 ``pairs_per_call`` 合并），费用按
+        ``CostConfig.batch_discount`` 折扣后的费率统计。
+        """
+        pairs = self.generate_pairs({'test_items': test_items, 'show_progress': False})['pairs_to_evaluate']
+
+        # 评估器可能依次用于多个特质，维度（含特质描述）每次都按本次调用重建
+        self.setup_structured_output(dimensions)
+        if self.use_json_schema:
+            response_format = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": self.dimension_model.__name__,
+                    "schema": self.dimension_model.model_json_schema(),
+                    "strict": True
+                }
+            }
+        else:
+            response_format = {"type": "json_object"}
+
+        requests = {}
+        for item1_id, item2_id, _ in pairs:
+            system_content, prompt = self._build_eval_messages(
+                test_items[item1_id], test_items[item2_id], dimensions
+            )
+            requests[f"{item1_id}|{item2_id}"] = {
+                "model": self.model_name,
+                "temperature": self.temperature,
+                "response_format": response_format,
+                "messages": [
+                    {"role": "system", "content": system_content},
+                    {"role": "user", "content": prompt}
+                ]
+            }
+
+        runner = BatchRunner(poll_interval=poll_interval, show_progress=show_progress)
+        bodies = runner.run(requests)
+
+        token_usage = TokenUsage()
+        evaluations = []
+        for custom_id in requests:
+            item1_id, item2_id = custom_id.split('|', 1)
+            if custom_id not in bodies:
+                print(f"⚠️  配对 {item1_id}-{item2_id} 请求失败，跳过此配对")
+                continue
+            body = bodies[custom_id]
+
+            usage = body.get('usage') or {}
+            token_usage.add(usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+
+            response_dict = self._parse_multi_dimension_evaluation_response_fallback(
+                BatchRunner.content(body), dimensions
+            )
+            evaluations.extend(
+                PairwiseEvaluation(
+                    item1_id=item1_id,
+                    item2_id=item2_id,
+                    dimension=dimension_name,
+                    winner=winner,
+                    evaluation_time=datetime.now().isoformat()
+                )
+                for dimension_name, winner in response_dict.items()
+            )
+
+        state = {
+            'completed_evaluations': evaluations,
+            'token_usage': token_usage,
+            'cost_config': self.cost_config.for_batch_api(),
+            'progress_bar': None
+        }
+        self.aggregate_results(state)
+        return self.create_dataframe(state)['final_results']
+
+    def _options_text(self, item: dict[str, Any]) -> str:
+        """题目选项的JSON文本；每个题目出现在多个配对中，只序列化一次"""
+        options = item['options']
+        cached = self._options_json.get(id(options))
+        if cached is None or cached[0] is not options:
+            cached = (options, json.dumps(options, ensure_ascii=False, indent=2))
+            self._options_json[id(options)] = cached
+        return cached[1]
+
+    def _dimensions_text(self, dimensions: list[dict[str, str]]) -> tuple[str, str]:
+        """维度说明与输出示例的文本；所有配对共用同一组维度，只构建一次"""
+        cached = self._dimensions_prompt
+        if cached is None or cached[0] is not dimensions:
+            descriptions = "\n".join(
+                f"{i}. {dim['name']}: {dim['description']}" for i, dim in enumerate(dimensions, 1)
+            )
+            output_example = {dim['name']: "A" for dim in dimensions}
+            cached = (dimensions, descriptions, json.dumps(output_example, ensure_ascii=False, indent=2))
+            self._dimensions_prompt = cached
+        return cached[1], cached[2]
+
     def create_single_eval(
         self,
         item1: dict[str, Any],
@@ -426,98 +797,97 @@ class PsychologicalItemEvaluator:
         dimensions: list[dict[str, str]]
     ) -> str:
         """创建多维度评估提示词，优化结构化输出"""
-        # 构建维度说明
-        dimension_descriptions = []
-        for i, dim in enumerate(dimensions, 1):
-            dimension_descriptions.append(f"{i}. {dim['name']}: {dim['description']}")
-        
-        # 构建期望的输出格式说明（简化版本）
-        output_example = {}
-        for dim in dimensions:
-            output_example[dim['name']] = "A"  # 示例值
+        dimension_descriptions, output_example = self._dimensions_text(dimensions)
         
         prompt = f"""请比较以下两个情景判断测验题目在多个维度上的质量。
 
 评估维度：
-{chr(10).join(dimension_descriptions)}
+{dimension_descriptions}
 
 题目A：
 情境：{item1['situation']}
-选项：{json.dumps(item1['options'], ensure_ascii=False, indent=2)}
+选项：{self._options_text(item1)}
 
 题目B：
 情境：{item2['situation']}
-选项：{json.dumps(item2['options'], ensure_ascii=False, indent=2)}
+选项：{self._options_text(item2)}
 
 请对每个维度分别评估哪个题目更好，选择"A"或"B"。
 
 输出示例格式：
-{json.dumps(output_example, ensure_ascii=False, indent=2)}
+{output_example}
 
 注意：只能选择"A"或"B"，不允许其他值。"""
         
         return prompt
 
+    def create_marshaled_eval(
+        self,
+        item_pairs: list[tuple[dict[str, Any], dict[str, Any]]],
+        dimensions: list[dict[str, str]]
+    ) -> str:
+        """创建多配对合并评估提示词：每组配对独立比较，结果按 pair_k 分组输出"""
+        # 输出示例按配对分组，与单配对不同，这里只复用维度说明
+        dimension_descriptions, _ = self._dimensions_text(dimensions)
+        
+        pair_sections = []
+        for k, (item1, item2) in enumerate(item_pairs, 1):
+            pair_sections.append(f"""### pair_{k}
+
+题目A：
+情境：{item1['situation']}
+选项：{self._options_text(item1)}
+
+题目B：
+情境：{item2['situation']}
+选项：{self._options_text(item2)}""")
+        
+        output_example = {
+            f"pair_{k}": {dim['name']: "A" for dim in dimensions}
+            for k in range(1, len(item_pairs) + 1)
+        }
+        
+        prompt = f"""请分别比较以下 {len(item_pairs)} 组情景判断测验题目在多个维度上的质量，每组配对相互独立。
+
+评估维度：
+{dimension_descriptions}
+
+{chr(10).join(pair_sections)}
+
+请对每组配对的每个维度分别评估哪个题目更好，选择"A"或"B"。
+
+输出示例格式：
+{json.dumps(output_example, ensure_ascii=False, indent=2)}
+
+注意：必须输出全部 {len(item_pairs)} 组配对，只能选择"A"或"B"，不允许其他值。"""
+        
+        return prompt
+
     def _parse_multi_dimension_evaluation_response_fallback(
         self, 
         response: str, 
         dimensions: list[dict[str, str]]
     ) -> dict[str, str]:
-        """回退方案：解析多维度LLM评估响应（使用原始JSON解析方法）"""
+        """回退方案：解析多维度LLM评估响应（使用原始JSON解析方法）
+        
+        缺失或取值无效的维度直接跳过，由调用方统一提示失败的维度数。
+        """
         try:
-            parsed = self._parse_json_with_retry(response)
-            
-            # 验证并清理结果
-            results = {}
-            for dim in dimensions:
-                dim_name = dim['name']
-                if dim_name in parsed:
-                    winner = str(parsed[dim_name]).upper()
-                    if winner in ['A', 'B']:
-                        results[dim_name] = winner
-                    else:
-                        # 无法解析时跳过该维度，而不是设置默认值
-                        print(f"⚠️  维度 {dim_name} 解析结果无效: {parsed[dim_name]}")
-                        continue
-                else:
-                    print(f"⚠️  维度 {dim_name} 在响应中缺失")
-                    continue
-            
-            return results
-            
-        except (json.JSONDecodeError, KeyError) as e:
-            # 如果JSON解析失败，返回空字典
+            return self._valid_dimension_results(self._parse_json(response), dimensions)
+        except (json.JSONDecodeError, AttributeError) as e:
+            # 如果JSON解析失败（或解析结果不是对象），返回空字典
             print(f"❌ JSON解析完全失败: {str(e)}")
             return {}
-
-    def _parse_json_with_retry(self, response: str, max_retries: int = 20) -> dict:
-        """带重试机制的JSON解析"""
-        import re
-        
-        for attempt in range(max_retries):
-            try:
-                # 尝试直接解析JSON
-                if response.strip().startswith('{'):
-                    return json.loads(response)
-                else:
-                    # 如果不是纯JSON，尝试提取JSON部分
-                    json_match = re.search(r'\{.*\}', response, re.DOTALL)
-                    if json_match:
-                        return json.loads(json_match.group())
-                    else:
-                        raise json.JSONDecodeError("No JSON found", "", 0)
-                        
-            except (json.JSONDecodeError, KeyError) as e:
-                if attempt < max_retries - 1:
-                    # 记录重试
-                    print(f"⚠️  JSON解析失败 (尝试 {attempt + 1}/{max_retries}): {str(e)[:100]}")
-                    # 可以在这里添加重新调用LLM的逻辑
-                    continue
-                else:
-                    print(f"❌ JSON解析最终失败，已达到最大重试次数 ({max_retries})")
-                    raise
-        
-        return {}
+    
+    def _parse_json(self, response: str) -> dict:
+        """解析JSON；不是纯JSON时提取其中的JSON部分（解析是确定性的，失败不再重试）"""
+        try:
+            return _json_loads(response)
+        except json.JSONDecodeError:
+            json_match = _JSON_OBJECT_RE.search(response)
+            if json_match is None:
+                raise
+            return _json_loads(json_match.group())
     
     def _parse_multi_dimension_evaluation_response(
         self, 
@@ -526,7 +896,7 @@ class PsychologicalItemEvaluator:
     ) -> dict[str, str]:
         """解析多维度LLM评估响应"""
         try:
-            parsed = self._parse_json_with_retry(response)
+            parsed = self._parse_json(response)
             
             # 验证并清理结果
             results = {}
@@ -534,7 +904,7 @@ class PsychologicalItemEvaluator:
                 dim_name = dim['name']
                 if dim_name in parsed:
                     winner = str(parsed[dim_name]).upper()
-                    if winner in ['A', 'B']:
+                    if winner in _VALID_WINNERS:
                         results[dim_name] = winner
                     else:
                         results[dim_name] = 'None'
@@ -547,18 +917,6 @@ class PsychologicalItemEvaluator:
             # 如果JSON解析失败，为所有维度返回默认值
             return {dim['name']: 'None' for dim in dimensions}
     
-    def should_continue_batching(self, state: EvaluationState) -> str:
-        """判断是否继续批处理"""
-        remaining_pairs = [
-            pair for pair in state['pairs_to_evaluate'] 
-            if not any(
-                eval.item1_id == pair[0] and eval.item2_id == pair[1]
-                for eval in state['completed_evaluations']
-            )
-        ]
-        
-        return "continue" if remaining_pairs else "end"
-    
     def aggregate_results(self, state: EvaluationState) -> dict[str, Any]:
         """聚合评估结果"""
         # 完成进度条
@@ -605,8 +963,15 @@ class PsychologicalItemEvaluator:
     
     def create_dataframe(self, state: EvaluationState) -> dict[str, Any]:
         """创建最终的DataFrame结果"""
-        data = [asdict(eval) for eval in state['completed_evaluations']]
-        df = pd.DataFrame(data)
+        # 按列收集，避免为每条评估结果构造中间dict
+        columns = [field.name for field in fields(PairwiseEvaluation)]
+        df = pd.DataFrame(
+            {
+                column: [getattr(eval, column) for eval in state['completed_evaluations']]
+                for column in columns
+            },
+            columns=columns
+        )
         
         # 显示结果摘要
         if len(df) > 0:
@@ -614,34 +979,18 @@ class PsychologicalItemEvaluator:
             # print(f"   平均置信度: {df['confidence'].mean():.3f}")
             # print(f"   置信度范围: {df['confidence'].min():.3f} - {df['confidence'].max():.3f}")
             
-            # 按维度显示胜率统计
+            # 按维度显示胜率统计（整列分组计数，不逐行遍历）
             print(f"\n🏆 各维度胜率统计:")
+            winners = df['item1_id'].where(df['winner'] == 'A', df['item2_id']).rename('item_id')
+            wins = winners.groupby(df['dimension']).value_counts()
+            item_ids = pd.concat([df['item1_id'], df['item2_id']], ignore_index=True).rename('item_id')
+            totals = item_ids.groupby(pd.concat([df['dimension'], df['dimension']], ignore_index=True)).value_counts()
+            win_rates = wins.reindex(totals.index, fill_value=0) / totals
+            
             for dimension in df['dimension'].unique():
-                dim_data = df[df['dimension'] == dimension]
                 print(f"   {dimension}:")
-                
-                # 计算每个题目的胜率
-                win_counts = {}
-                total_counts = {}
-                
-                for _, row in dim_data.iterrows():
-                    winner_id = row['item1_id'] if row['winner'] == 'A' else row['item2_id']
-                    loser_id = row['item2_id'] if row['winner'] == 'A' else row['item1_id']
-                    
-                    win_counts[winner_id] = win_counts.get(winner_id, 0) + 1
-                    win_counts[loser_id] = win_counts.get(loser_id, 0)
-                    
-                    total_counts[row['item1_id']] = total_counts.get(row['item1_id'], 0) + 1
-                    total_counts[row['item2_id']] = total_counts.get(row['item2_id'], 0) + 1
-                
-                # 计算并显示胜率
-                win_rates = {
-                    item_id: win_counts.get(item_id, 0) / total_counts.get(item_id, 1)
-                    for item_id in total_counts
-                }
-                
-                sorted_items = sorted(win_rates.items(), key=lambda x: x[1], reverse=True)
-                for i, (item_id, rate) in enumerate(sorted_items[:3], 1):
+                top_items = win_rates.loc[dimension].sort_values(ascending=False, kind='stable').head(3)
+                for i, (item_id, rate) in enumerate(top_items.items(), 1):
                     print(f"     {i}. 题目{item_id}: {rate:.1%} 胜率")
         df.rename(columns={'item1_id': 'A', 'item2_id': 'B'}, inplace=True)
         
@@ -653,12 +1002,36 @@ class PsychologicalItemEvaluator:
         dimensions: list[dict[str, str]],
         batch_size: int = 10,
         max_concurrent: int = 5,
-        show_progress: bool = True
+        show_progress: bool = True,
+        pairs_per_call: int = 1,
+        execution_mode: Literal['asyncio', 'process_pool'] = 'asyncio',
+        n_workers: Optional[int] = None,
+        use_batch_api: bool = False
     ) -> pd.DataFrame:
-        """主要的评估入口函数（同步版本）"""
+        """主要的评估入口函数（同步版本）
+        
+        所有配对在同一个事件循环中并发评估，``max_concurrent`` 限制在途请求数；
+        ``batch_size`` 仅为兼容旧调用保留，不再分批。``pairs_per_call`` > 1 时
+        每次API调用合并评估多组配对，请求数按比例减少（适用于受QPM限制的接口）。
+        
+        ``execution_mode='process_pool'`` 时配对分片到 ``n_workers`` 个子进程
+        （默认CPU核数），每个进程独立建立连接。用于本地Ollama等服务时，需设置
+        ``OPENAI_BASE_URL`` 指向其OpenAI兼容接口，并以 ``OLLAMA_NUM_PARALLEL``
+        启动服务（不小于 ``n_workers``），否则服务端仍会串行处理请求。
+        
+        ``use_batch_api=True`` 时改为通过 Batch API 离线评估（约半价，异步完成），
+        每个配对单独一个请求，``pairs_per_call``/``execution_mode`` 不起作用；
+        服务商不支持时回退到实时评估。
+        """
+        
+        # 评估器可能依次用于多个特质，结构化输出模型与解析器按本次的维度重建
+        self.setup_structured_output(dimensions)
         
         # 预估费用
         estimated_usage, estimated_cost = self.estimate_cost_for_evaluation(test_items, dimensions)
+        cost_config = self.cost_config.for_batch_api() if use_batch_api else self.cost_config
+        if use_batch_api:
+            estimated_cost = cost_config.calculate_cost(estimated_usage)
         
         # 显示开始信息
         total_items = len(test_items)
@@ -670,7 +1043,6 @@ class PsychologicalItemEvaluator:
             print(f"📝 题目数量: {total_items}")
             print(f"📏 评估维度: {total_dimensions}")
             print(f"🔍 配对总数: {total_pairs}（每对评估{total_dimensions}个维度）")
-            print(f"⚙️  批处理大小: {batch_size}")
             print(f"🔄 最大并发: {max_concurrent}")
             print(f"💡 优化: 单次API调用评估所有维度，减少{(total_dimensions-1)*total_pairs}次调用")
             
@@ -680,7 +1052,7 @@ class PsychologicalItemEvaluator:
             print(f"   预估输出tokens: {estimated_usage.output_tokens:,}")
             print(f"   预估总tokens: {estimated_usage.total_tokens:,}")
             print(f"   预估总费用: ${estimated_cost:.4f}")
-            print(f"   费率配置: 输入${self.cost_config.input_token_rate}/1M tokens, 输出${self.cost_config.output_token_rate}/1M tokens")
+            print(f"   费率配置: 输入${cost_config.input_token_rate}/1M tokens, 输出${cost_config.output_token_rate}/1M tokens")
             
             print("-" * 50)
             
@@ -690,17 +1062,25 @@ class PsychologicalItemEvaluator:
             #     print("评估已取消")
             #     return pd.DataFrame()
         
+        if use_batch_api:
+            try:
+                return self.evaluate_test_items_batch(test_items, dimensions, show_progress=show_progress)
+            except APIStatusError as e:
+                # 服务商不支持 Batch 接口时回退到实时并发调用
+                print(f"⚠️  Batch API 不可用，回退到实时评估: {str(e)[:100]}")
+        
         # 创建初始状态（使用正确的类型）
         initial_state = {
             'test_items': test_items,
             'dimensions': dimensions,
             'pairs_to_evaluate': [],
             'completed_evaluations': [],
-            'current_batch': [],
-            'batch_results': [],
             'final_results': None,
             'batch_size': batch_size,
             'max_concurrent': max_concurrent,
+            'pairs_per_call': pairs_per_call,
+            'execution_mode': execution_mode,
+            'n_workers': n_workers,
             'show_progress': show_progress,
             'total_pairs': 0,
             'progress_bar': None,
@@ -709,9 +1089,10 @@ class PsychologicalItemEvaluator:
         }
         
         try:
-            # 创建并运行工作流
-            workflow = self.create_evaluation_workflow()
-            final_state = workflow.invoke(initial_state)
+            # 运行工作流（首次使用时编译）
+            if self._compiled_workflow is None:
+                self._compiled_workflow = self.create_evaluation_workflow()
+            final_state = self._compiled_workflow.invoke(initial_state)
             
             # 返回最终结果
             return final_state.get('final_results')
@@ -727,4 +1108,20 @@ class PsychologicalItemEvaluator:
             if initial_state.get('progress_bar'):
                 initial_state['progress_bar'].close()
             print(f"\n❌ 评估过程中出现错误: {e}")
-            raise
\ No newline at end of file
+            raise
+
+
+def _evaluate_pair_shard(
+    settings: dict[str, Any],
+    pairs: list[tuple[str, str]],
+    test_items: dict[str, dict[str, Any]],
+    dimensions: list[dict[str, str]],
+    max_concurrent: int,
+    pairs_per_call: int
+) -> tuple[list[PairwiseEvaluation], TokenUsage]:
+    """进程池工作函数：在子进程中新建评估器，评估分到的配对"""
+    evaluator = PsychologicalItemEvaluator(**settings)
+    evaluator.setup_structured_output(dimensions)
+    return evaluator._run(evaluator._evaluate_pairs_async(
+        pairs, test_items, dimensions, max_concurrent, pairs_per_call
+    ))
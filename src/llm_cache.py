@@ -0,0 +1,164 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional, Sequence, Union
+
+import numpy as np
+
+
+class ResponseCache:
+    """Persistent exact-match cache of LLM responses, stored in SQLite.
+
+    The key hashes everything that determines a request (model, temperature,
+    response format and the full message list), so a cached answer is only
+    reused for a byte-identical prompt.
+
+    Parameters
+    ----------
+    path : str or Path, optional
+        SQLite file, created if missing. ``":memory:"`` keeps the cache for
+        the current process only.
+    memory_size : int, optional
+        Number of recently used responses also kept in a dict, so hot keys
+        skip the SQLite lookup. ``0`` disables the in-memory layer.
+    """
+
+    def __init__(self, path: Union[str, Path] = ".llm_cache.sqlite", memory_size: int = 4096):
+        self.path = str(path)
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, temperature REAL, response TEXT)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(
+        messages: list[dict[str, str]],
+        model: str,
+        response_format: Union[str, dict[str, Any]],
+        temperature: Optional[float],
+    ) -> str:
+        payload = json.dumps(
+            [model, temperature, response_format, messages],
+            ensure_ascii=False,
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the raw response text for ``key``, or None on a miss."""
+        with self._lock:
+            response = self._memory.get(key)
+            if response is not None:
+                self._memory.move_to_end(key)
+            else:
+                row = self._conn.execute(
+                    "SELECT response FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    response = row[0]
+                    self._remember(key, response)
+            self.stats["hits" if response is not None else "misses"] += 1
+        return response
+
+    def _remember(self, key: str, response: str) -> None:
+        if self.memory_size <= 0:
+            return
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def set(self, key: str, response: str, model: str, temperature: Optional[float]) -> None:
+        with self._lock:
+            self._remember(key, response)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, model, temperature, response),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self.stats = {"hits": 0, "misses": 0}
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class SemanticCache:
+    """In-process cache that reuses the response to a *similar* earlier request.
+
+    Requests are grouped by everything except the final user message (model,
+    temperature, response format, system prompt and one-shot turns); within a
+    group the final message is embedded and the stored response whose
+    embedding has the highest cosine similarity is returned if it reaches
+    ``threshold``. Only use it for steps whose answer does not hinge on small
+    wording differences of the input.
+
+    Parameters
+    ----------
+    threshold : float, optional
+        Minimum cosine similarity for a hit.
+    embedding_model : str, optional
+        Embedding model used to embed the final user message.
+    """
+
+    def __init__(self, threshold: float = 0.92, embedding_model: str = "text-embedding-3-small"):
+        self.threshold = threshold
+        self.embedding_model = embedding_model
+        # namespace -> (unit-norm embeddings stacked row-wise, responses)
+        self._entries: dict[str, tuple[np.ndarray, list[str]]] = {}
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, namespace: str, vector: Sequence[float]) -> Optional[str]:
+        """Return the response of the most similar stored request, or None below ``threshold``."""
+        with self._lock:
+            matrix, responses = self._entries.get(namespace, (None, None))
+            response = None
+            if matrix is not None:
+                similarity = matrix @ self._unit(vector)
+                best = int(similarity.argmax())
+                if similarity[best] >= self.threshold:
+                    response = responses[best]
+            self.stats["hits" if response is not None else "misses"] += 1
+        return response
+
+    def add(self, namespace: str, vector: Sequence[float], response: str) -> None:
+        row = self._unit(vector)[None, :]
+        with self._lock:
+            matrix, responses = self._entries.get(namespace, (None, []))
+            matrix = row if matrix is None else np.vstack([matrix, row])
+            self._entries[namespace] = (matrix, [*responses, response])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.stats = {"hits": 0, "misses": 0}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(responses) for _, responses in self._entries.values())
@@ -0,0 +1,399 @@
+import asyncio
+import importlib.util
+import json
+import threading
+import weakref
+from string import Template
+from typing import Any, Callable, Optional, Union
+
+import httpx
+from lmitf import TemplateLLM
+from openai import APIConnectionError, AsyncOpenAI, RateLimitError
+from pydantic import BaseModel
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+from .llm_cache import ResponseCache, SemanticCache
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib parser
+    orjson = None
+
+DEFAULT_LIMITS = httpx.Limits(
+    max_connections=200,
+    max_keepalive_connections=100,
+    keepalive_expiry=60,
+)
+DEFAULT_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+# httpx only speaks HTTP/2 with the optional h2 dependency (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# APIConnectionError also covers timeouts (APITimeoutError wraps httpx.ReadTimeout etc.)
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError)
+
+MAX_RETRY_AFTER = 60.0
+
+# Corrective turn sent after a reply that does not parse as the requested JSON.
+JSON_REPAIR_PROMPT = "Your previous reply was not valid JSON. Return valid JSON only."
+
+# httpx connections are bound to the event loop that opened them, so the
+# shared client is kept per loop and dropped together with it.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
+# Requests currently on the wire, per loop, for AsyncBaseLLM(coalesce=True).
+_in_flight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Future]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+_backoff = wait_random_exponential(min=1, max=30)
+
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_lock = threading.Lock()
+
+
+def _wait_retry_after(retry_state) -> float:
+    """Wait as long as the server's ``Retry-After`` asks, else use jittered exponential backoff."""
+    response = getattr(retry_state.outcome.exception(), "response", None)
+    if response is not None:
+        try:
+            return min(float(response.headers.get("retry-after")), MAX_RETRY_AFTER)
+        except (TypeError, ValueError):
+            pass
+    return _backoff(retry_state)
+
+
+def make_http_client(**kwargs) -> httpx.AsyncClient:
+    """Create an ``httpx.AsyncClient`` with the pool limits used for LLM calls.
+
+    HTTP/2 is enabled when the ``h2`` package is installed, so concurrent
+    requests are multiplexed over a few connections instead of one each.
+    """
+    kwargs.setdefault("http2", HTTP2_AVAILABLE)
+    kwargs.setdefault("limits", DEFAULT_LIMITS)
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    return httpx.AsyncClient(**kwargs)
+
+
+def set_pool_limits(
+    max_connections: int = 200,
+    max_keepalive_connections: int = 100,
+    keepalive_expiry: float = 60.0,
+) -> None:
+    """Set the connection-pool limits of clients created by :func:`make_http_client`.
+
+    The shared per-loop client is created on first use, so call this before
+    generating (or pass your own ``http_client``) for the limits to apply.
+    """
+    global DEFAULT_LIMITS
+    DEFAULT_LIMITS = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+
+
+def get_async_client() -> AsyncOpenAI:
+    """Return the ``AsyncOpenAI`` client shared by every caller on the running loop.
+
+    Credentials come from ``OPENAI_API_KEY`` / ``OPENAI_BASE_URL``.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = AsyncOpenAI(http_client=make_http_client(), max_retries=0)
+        _clients[loop] = client
+    return client
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Event loop running forever in a daemon thread, created on first use.
+
+    Synchronous entry points called from inside a running loop (e.g. Jupyter)
+    submit their coroutines here instead of re-entering the caller's loop.
+    Since the loop outlives each call, so does its pooled HTTP client.
+    """
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="sjt-background-loop", daemon=True).start()
+            _background_loop = loop
+    return _background_loop
+
+
+# "text", "json" (any JSON object) or a pydantic model to enforce as a strict JSON schema
+ResponseFormat = Union[str, type[BaseModel]]
+
+
+def response_format_param(response_format: ResponseFormat) -> Optional[dict[str, Any]]:
+    """Chat-completion ``response_format`` argument for ``response_format``.
+
+    A pydantic model becomes a strict JSON schema, so the model is constrained
+    to it while decoding instead of being validated (and retried) afterwards.
+    Its fields must all be required and it must forbid extra keys.
+    """
+    if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": response_format.__name__,
+                "schema": response_format.model_json_schema(),
+                "strict": True,
+            },
+        }
+    if response_format == "json":
+        return {"type": "json_object"}
+    return None
+
+
+def parse_response(content: str, response_format: ResponseFormat) -> Any:
+    """Decode response text: dict for ``"json"`` and schema formats, else the text."""
+    if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+        return response_format.model_validate_json(content).model_dump(by_alias=True)
+    if response_format == "json":
+        return orjson.loads(content) if orjson is not None else json.loads(content)
+    return content
+
+
+class AsyncBaseLLM:
+    """Async counterpart of ``lmitf.BaseLLM``: sends chat messages on a pooled connection.
+
+    Parameters
+    ----------
+    http_client : httpx.AsyncClient, optional
+        Client to send requests through. It must only be used from one event
+        loop. Defaults to the per-loop client from :func:`get_async_client`.
+    cache : ResponseCache, optional
+        Reuse responses to byte-identical requests (e.g. across reruns while
+        developing). Off by default, since generation relies on sampling.
+    coalesce : bool, optional
+        Let identical non-streaming requests that are in flight at the same
+        time share a single API call and its answer.
+    max_repairs : int, optional
+        When a JSON reply does not parse, send it back with a corrective turn
+        up to this many times before raising. ``0`` raises straight away.
+    semantic_cache : SemanticCache, optional
+        Reuse the response to an earlier request whose final message is
+        similar enough (costs one embedding request per call). Off by default.
+    """
+
+    def __init__(
+        self,
+        http_client: Optional[httpx.AsyncClient] = None,
+        cache: Optional[ResponseCache] = None,
+        coalesce: bool = False,
+        max_repairs: int = 2,
+        semantic_cache: Optional[SemanticCache] = None,
+    ):
+        self._async_client = (
+            AsyncOpenAI(http_client=http_client, max_retries=0) if http_client is not None else None
+        )
+        self.cache = cache
+        self.coalesce = coalesce
+        self.max_repairs = max_repairs
+        self.semantic_cache = semantic_cache
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        return self._async_client or get_async_client()
+
+    @retry(
+        wait=_wait_retry_after,
+        stop=stop_after_attempt(6),
+        retry=retry_if_exception_type(RETRYABLE_ERRORS),
+        reraise=True,
+    )
+    async def _create(self, **kwargs):
+        """Send one chat completion request, backing off with jitter on rate limits and timeouts."""
+        return await self.async_client.chat.completions.create(**kwargs)
+
+    @retry(
+        wait=_wait_retry_after,
+        stop=stop_after_attempt(6),
+        retry=retry_if_exception_type(RETRYABLE_ERRORS),
+        reraise=True,
+    )
+    async def _embed(self, text: str) -> list[float]:
+        """Embed ``text`` with the semantic cache's embedding model."""
+        response = await self.async_client.embeddings.create(
+            model=self.semantic_cache.embedding_model, input=text
+        )
+        return response.data[0].embedding
+
+    async def acall(
+        self,
+        messages: list[dict[str, str]],
+        model: str,
+        response_format: ResponseFormat = "text",
+        temperature: Optional[float] = None,
+        on_delta: Optional[Callable[[str], None]] = None,
+    ) -> Any:
+        """Send ``messages``; returns a dict when ``response_format`` is ``'json'`` or a model.
+
+        When ``on_delta`` is given the completion is streamed and each content
+        chunk is passed to it as it arrives. The return value is the same: the
+        full text is buffered and parsed once the stream ends.
+        """
+        format_param = response_format_param(response_format)
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(messages, model, format_param or response_format, temperature)
+            cached = self.cache.get(key)
+            if cached is not None:
+                if on_delta is not None:
+                    on_delta(cached)
+                return parse_response(cached, response_format)
+
+        if self.semantic_cache is not None:
+            namespace = ResponseCache.make_key(
+                messages[:-1], model, format_param or response_format, temperature
+            )
+            vector = await self._embed(messages[-1]["content"])
+            cached = self.semantic_cache.lookup(namespace, vector)
+            if cached is not None:
+                if on_delta is not None:
+                    on_delta(cached)
+                return parse_response(cached, response_format)
+
+        kwargs = {}
+        if format_param is not None:
+            kwargs["response_format"] = format_param
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+
+        if self.coalesce and on_delta is None:
+            if key is None:
+                key = ResponseCache.make_key(messages, model, format_param or response_format, temperature)
+            content = await self._coalesced(key, messages, model, kwargs)
+        else:
+            content = await self._fetch(messages, model, kwargs, on_delta)
+        try:
+            result = parse_response(content, response_format)
+        except ValueError:
+            if not self.max_repairs:
+                raise
+            content, result = await self._repair(messages, model, kwargs, content, response_format)
+        # only cache responses that parsed
+        if self.cache is not None:
+            self.cache.set(key, content, model, temperature)
+        if self.semantic_cache is not None:
+            self.semantic_cache.add(namespace, vector, content)
+        return result
+
+    async def _fetch(
+        self,
+        messages: list[dict[str, str]],
+        model: str,
+        kwargs: dict[str, Any],
+        on_delta: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        """Send the request and return the raw message text."""
+        if on_delta is None:
+            response = await self._create(model=model, messages=messages, **kwargs)
+            return response.choices[0].message.content
+
+        stream = await self._create(model=model, messages=messages, stream=True, **kwargs)
+        parts = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                on_delta(delta)
+        return "".join(parts)
+
+    async def _repair(
+        self,
+        messages: list[dict[str, str]],
+        model: str,
+        kwargs: dict[str, Any],
+        content: str,
+        response_format: ResponseFormat,
+    ) -> tuple[str, Any]:
+        """Ask again with the unparsable reply and a corrective turn appended.
+
+        Returns the new text and its parsed value; the last parse error is
+        raised if no reply parses within ``max_repairs`` attempts.
+        """
+        for attempt in range(self.max_repairs):
+            messages = [
+                *messages,
+                {"role": "assistant", "content": content},
+                {"role": "user", "content": JSON_REPAIR_PROMPT},
+            ]
+            content = await self._fetch(messages, model, kwargs)
+            try:
+                return content, parse_response(content, response_format)
+            except ValueError:
+                if attempt == self.max_repairs - 1:
+                    raise
+
+    async def _coalesced(
+        self,
+        key: str,
+        messages: list[dict[str, str]],
+        model: str,
+        kwargs: dict[str, Any],
+    ) -> str:
+        """Join an identical in-flight request if there is one, else start it."""
+        pending = _in_flight.setdefault(asyncio.get_running_loop(), {})
+        future = pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(messages, model, kwargs))
+            pending[key] = future
+            future.add_done_callback(lambda _: pending.pop(key, None))
+        # one caller being cancelled must not cancel the shared request
+        return await asyncio.shield(future)
+
+
+class AsyncTemplateLLM(TemplateLLM):
+    """``TemplateLLM`` with a native async ``acall`` on a pooled connection.
+
+    Parameters
+    ----------
+    template_path : str
+        Path of the prompt module (must define ``prompt_template``).
+    http_client : httpx.AsyncClient, optional
+        Passed to :class:`AsyncBaseLLM`.
+    cache : ResponseCache, optional
+        Passed to :class:`AsyncBaseLLM`.
+    semantic_cache : SemanticCache, optional
+        Passed to :class:`AsyncBaseLLM`.
+    """
+
+    def __init__(
+        self,
+        template_path: str,
+        http_client: Optional[httpx.AsyncClient] = None,
+        cache: Optional[ResponseCache] = None,
+        semantic_cache: Optional[SemanticCache] = None,
+    ):
+        super().__init__(template_path)
+        self.async_llm = AsyncBaseLLM(http_client, cache=cache, semantic_cache=semantic_cache)
+        # the template is fixed after loading, so parse the final message once
+        *self._history, self._frame = self.prompt_template
+        self._frame_template = Template(self._frame["content"])
+
+    def render(self, **variables) -> list[dict[str, str]]:
+        """Fill the ``$`` placeholders of the final (conditioned) message."""
+        content = self._frame_template.substitute(variables)
+        return [*self._history, {**self._frame, "content": content}]
+
+    async def acall(
+        self,
+        model: str,
+        response_format: ResponseFormat = "text",
+        temperature: Optional[float] = None,
+        on_delta: Optional[Callable[[str], None]] = None,
+        **variables,
+    ) -> Any:
+        """Async counterpart of ``call``: render the template and send it via :class:`AsyncBaseLLM`."""
+        return await self.async_llm.acall(
+            self.render(**variables),
+            model=model,
+            response_format=response_format,
+            temperature=temperature,
+            on_delta=on_delta,
+        )
@@ -1,57 +1,154 @@
 # %%
+import io
+import zipfile
 from datetime import datetime
-from docx import Document
-from docx.shared import Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.oxml.shared import OxmlElement, qn
+from functools import lru_cache
+from xml.sax.saxutils import escape
 import json
 import os
+import re
+
+# 题目文本中重复的片段（相同选项、特质名等）只转义一次
+_escape = lru_cache(maxsize=8192)(escape)
+
+# res_to_doc只输出标题和段落，直接写出最小的OOXML包，不经过python-docx的Document对象
+_W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+_XML_DECL = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+_CONTENT_TYPES_XML = (
+    _XML_DECL
+    + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '</Types>'
+)
+
+_RELS_XML = (
+    _XML_DECL
+    + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+_DOCUMENT_RELS_XML = (
+    _XML_DECL
+    + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+def _heading_style_xml(style_id, name, level, before, size):
+    """标题段落样式；字号和颜色由run格式覆盖"""
+    return (
+        f'<w:style w:type="paragraph" w:styleId="{style_id}"><w:name w:val="{name}"/>'
+        '<w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:qFormat/>'
+        f'<w:pPr><w:keepNext/><w:keepLines/><w:spacing w:before="{before}" w:after="0"/>'
+        f'<w:outlineLvl w:val="{level}"/></w:pPr>'
+        f'<w:rPr><w:b/><w:bCs/><w:sz w:val="{size}"/><w:szCs w:val="{size}"/></w:rPr></w:style>'
+    )
+
+_STYLES_XML = (
+    _XML_DECL
+    + f'<w:styles xmlns:w="{_W_NS}">'
+    '<w:docDefaults><w:rPrDefault><w:rPr>'
+    '<w:rFonts w:ascii="Times New Roman" w:hAnsi="Times New Roman" w:eastAsia="宋体" w:cs="宋体"/>'
+    '<w:sz w:val="24"/><w:szCs w:val="24"/><w:lang w:val="en-US" w:eastAsia="zh-CN"/>'
+    '</w:rPr></w:rPrDefault><w:pPrDefault/></w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+    + _heading_style_xml('Heading1', 'heading 1', 0, 480, 28)
+    + _heading_style_xml('Heading2', 'heading 2', 1, 200, 26)
+    + '</w:styles>'
+)
+
+# 固定部件只编码一次，每次生成文档时直接写入
+_SKELETON_PARTS = tuple(
+    (name, xml.encode('utf-8'))
+    for name, xml in (
+        ('[Content_Types].xml', _CONTENT_TYPES_XML),
+        ('_rels/.rels', _RELS_XML),
+        ('word/_rels/document.xml.rels', _DOCUMENT_RELS_XML),
+        ('word/styles.xml', _STYLES_XML),
+    )
+)
+
+_DOCUMENT_START = _XML_DECL + f'<w:document xmlns:w="{_W_NS}"><w:body>'
+# Letter纸张、1英寸上下边距（与python-docx默认模板一致）
+_DOCUMENT_END = (
+    '<w:sectPr><w:pgSz w:w="12240" w:h="15840"/>'
+    '<w:pgMar w:top="1440" w:right="1800" w:bottom="1440" w:left="1800" '
+    'w:header="720" w:footer="720" w:gutter="0"/></w:sectPr>'
+    '</w:body></w:document>'
+)
+
+@lru_cache(maxsize=None)
+def _body_rpr_xml(font_size=12, chinese_font='宋体', english_font='Times New Roman'):
+    """正文run格式（小四号，汉字宋体，英文Times New Roman）的 <w:rPr> XML"""
+    return (f'<w:rPr><w:rFonts w:ascii="{english_font}" w:hAnsi="{english_font}" '
+            f'w:eastAsia="{chinese_font}" w:cs="{chinese_font}"/>'
+            f'<w:sz w:val="{int(font_size * 2)}"/></w:rPr>')
+
+@lru_cache(maxsize=None)
+def _heading_rpr_xml(font_size=16, font_name='黑体', color='000000'):
+    """标题run格式的 <w:rPr> XML"""
+    return (f'<w:rPr><w:rFonts w:ascii="{font_name}" w:hAnsi="{font_name}" '
+            f'w:eastAsia="{font_name}" w:cs="{font_name}"/>'
+            f'<w:color w:val="{color}"/><w:sz w:val="{int(font_size * 2)}"/></w:rPr>')
+
+def _paragraph_xml(text, rpr_xml='', ppr_xml=''):
+    """段落的 <w:p> XML：与python-docx的add_run一致，换行和制表符转为对应元素"""
+    if not text:
+        return f'<w:p>{ppr_xml}</w:p>'
+    parts = []
+    for i, line in enumerate(text.split('\n')):
+        if i:
+            parts.append('<w:br/>')
+        for j, segment in enumerate(line.split('\t')):
+            if j:
+                parts.append('<w:tab/>')
+            if segment:
+                parts.append(f'<w:t xml:space="preserve">{_escape(segment)}</w:t>')
+    return f'<w:p>{ppr_xml}<w:r>{rpr_xml}{"".join(parts)}</w:r></w:p>'
+
+def _flatten(sjt_data):
+    """按输出顺序生成 (段落类型, 文本)：h1/h2为标题，p为正文，empty为空行"""
+    # 大标题：居中对齐，黑体三号
+    yield 'h1', 'SJTAgent-text生成结果'
+    for trait_key, trait_items in sjt_data.items():
+        # 小标题：黑体小四号
+        yield 'h2', f'特质：{trait_key}'
+        # 题目按字典顺序输出；save_result按编号升序写入，无需再排序
+        if isinstance(trait_items, dict):
+            trait_items = trait_items.items()
+        for idx_str, sjt in trait_items:
+            # 题目、情景、选项段落：小四号，汉字宋体，英文Times New Roman
+            yield 'p', f'题目 {idx_str}（特质：{trait_key}）'
+            if isinstance(sjt, dict):
+                if 'situation' in sjt:
+                    yield 'p', f'情景：{sjt["situation"]}'
+                options = sjt.get('options')
+                if isinstance(options, dict):
+                    for opt_key in ('A', 'B', 'C', 'D'):
+                        if opt_key in options:
+                            yield 'p', f'{opt_key}. {options[opt_key]}'
+            # 空行
+            yield 'empty', ''
 
-def set_paragraph_font(paragraph, font_size=12, chinese_font='宋体', english_font='Times New Roman'):
-    """设置段落字体格式：小四号，汉字宋体，英文Times New Roman"""
-    # 如果段落没有runs，先添加一个空的run
-    if not paragraph.runs:
-        paragraph.add_run('')
-
-    for run in paragraph.runs:
-        run.font.size = Pt(font_size)
-        run.font.name = english_font
-
-        # 使用更完整的字体设置方法
-        rPr = run._element.get_or_add_rPr()
-        rFonts = rPr.get_or_add_rFonts()
-        rFonts.set(qn('w:ascii'), english_font)
-        rFonts.set(qn('w:hAnsi'), english_font)
-        rFonts.set(qn('w:eastAsia'), chinese_font)
-        rFonts.set(qn('w:cs'), chinese_font)
-
-def set_heading_font(heading, font_size=16, font_name='黑体', color='000000'):
-    """设置标题字体格式和颜色"""
-    if not heading.runs:
-        heading.add_run('')
-
-    for run in heading.runs:
-        run.font.size = Pt(font_size)
-        run.font.name = font_name
-
-        # 使用更完整的字体设置方法
-        rPr = run._element.get_or_add_rPr()
-        rFonts = rPr.get_or_add_rFonts()
-        rFonts.set(qn('w:ascii'), font_name)
-        rFonts.set(qn('w:hAnsi'), font_name)
-        rFonts.set(qn('w:eastAsia'), font_name)
-        rFonts.set(qn('w:cs'), font_name)
-
-        # 设置颜色
-        color_elem = rPr.get_or_add_color()
-        color_elem.set(qn('w:val'), color)
-
-def res_to_doc(sjt_data, output_docx_file=None):
+def res_to_doc(sjt_data, output_docx_file=None, compression_level=6):
     """生成SJT文档的主函数
 
     Args:
-        sjt_data (dict): SJT数据字典
+        sjt_data (dict): SJT数据字典，{特质: {题号: 题目}}，题目按插入顺序输出；
+            每个特质的题目也可以是 (题号, 题目) 的可迭代对象，逐条读取
         output_docx_file (str, optional): 输出的DOCX文件路径，如果不指定则自动生成
+        compression_level (int, optional): DEFLATE压缩级别（0-9），1最快，9文件最小
 
     Returns:
         str: 生成的文档路径，如果失败返回None
@@ -66,55 +163,34 @@ def res_to_doc(sjt_data, output_docx_file=None):
         timestamp = datetime.now().strftime('%Y%m%d')
         base_name = f'SJTAgent_v0.1_{timestamp}'
         extension = '.docx'
-        docx_path = f'{base_name}{extension}'
 
-        # 避免文件名冲突
-        counter = 1
-        while os.path.exists(docx_path):
-            docx_path = f'{base_name}_{counter}{extension}'
-            counter += 1
+        # 避免文件名冲突：扫描一次当前目录，取已用编号的最大值+1
+        pattern = re.compile(rf'^{re.escape(base_name)}(?:_(\d+))?{re.escape(extension)}$')
+        used = [int(m.group(1) or 0) for m in map(pattern.match, os.listdir('.')) if m]
+        next_n = max(used, default=-1) + 1
+        docx_path = f'{base_name}{extension}' if next_n == 0 else f'{base_name}_{next_n}{extension}'
     else:
         docx_path = output_docx_file
 
-    doc = Document()
-
-    # 设置大标题：居中对齐，黑体三号
-    title = doc.add_heading('SJTAgent-text生成结果', level=1)
-    set_heading_font(title, font_size=16, font_name='黑体')
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-    for trait_key in sjt_data:
-        # 设置小标题：黑体小四号
-        subtitle = doc.add_heading(f'特质：{trait_key}', level=2)
-        set_heading_font(subtitle, font_size=12, font_name='黑体')
-
-        trait_items = sjt_data[trait_key]
-        for idx_str in sorted(trait_items.keys(), key=lambda x: int(x)):
-            sjt = trait_items[idx_str]
-
-            # 题目段落：小四号，汉字宋体，英文Times New Roman
-            title_para = doc.add_paragraph(f'题目 {idx_str}（特质：{trait_key}）')
-            set_paragraph_font(title_para)
-
-            if isinstance(sjt, dict) and 'situation' in sjt:
-                # 情景段落：小四号，汉字宋体，英文Times New Roman
-                situation_para = doc.add_paragraph(f'情景：{sjt["situation"]}')
-                set_paragraph_font(situation_para)
-
-            options = sjt.get('options') if isinstance(sjt, dict) else None
-            if isinstance(options, dict):
-                for opt_key in ['A', 'B', 'C', 'D']:
-                    if opt_key in options:
-                        # 选项段落：小四号，汉字宋体，英文Times New Roman
-                        option_para = doc.add_paragraph(f'{opt_key}. {options[opt_key]}')
-                        set_paragraph_font(option_para)
-
-            # 空行
-            empty_para = doc.add_paragraph('')
-            if empty_para.runs:
-                set_paragraph_font(empty_para)
-
-    doc.save(docx_path)
+    # 各类段落的 (run格式, 段落格式)
+    formats = {
+        'h1': (_heading_rpr_xml(font_size=16), '<w:pPr><w:pStyle w:val="Heading1"/><w:jc w:val="center"/></w:pPr>'),
+        'h2': (_heading_rpr_xml(font_size=12), '<w:pPr><w:pStyle w:val="Heading2"/></w:pPr>'),
+        'p': (_body_rpr_xml(), ''),
+        'empty': ('', ''),
+    }
+
+    out = io.StringIO()
+    out.write(_DOCUMENT_START)
+    for kind, text in _flatten(sjt_data):
+        out.write(_paragraph_xml(text, *formats[kind]))
+    out.write(_DOCUMENT_END)
+
+    # 一次写出并压缩全部部件
+    with zipfile.ZipFile(docx_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=compression_level) as zf:
+        for name, data in _SKELETON_PARTS:
+            zf.writestr(name, data)
+        zf.writestr('word/document.xml', out.getvalue())
     print(f"文档已保存为: {docx_path}")
     return docx_path
 
@@ -1,4 +1,11 @@
 import asyncio
+import copy
+import os
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from .llm_cache import ResponseCache
+from .llm_client import get_background_loop
+from .utils.io import dump_json_stream
 from .workflow.main import SJTAgent
 from typing import Optional
 from tqdm.auto import tqdm
@@ -19,6 +26,8 @@ class SJTRunner:
         target_population: Optional[str] = None,
         scale: Optional[dict] = None,
         meta: Optional[dict] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
+        cache: Optional[ResponseCache] = None,
         ):
         """
         Initialize the SJTRunner.
@@ -28,6 +37,12 @@ class SJTRunner:
         generator : SJTAgent, optional
             An instance of the SJTAgent class used to generate items.
             If not provided, must be set before calling generation methods.
+        http_client : httpx.AsyncClient, optional
+            Pooled client shared by all LLM requests of the internally created
+            SJTAgent. Ignored when ``generator`` is given.
+        cache : ResponseCache, optional
+            Response cache for the internally created SJTAgent; identical
+            requests reuse the stored answer. Ignored when ``generator`` is given.
         """
         assert not (generator is not None and situation_theme is not None), \
             "generator and situation_theme cannot both be provided"
@@ -39,6 +54,8 @@ class SJTRunner:
                 situation_theme=situation_theme,
                 target_population=target_population,
                 show_progress=False, # will be handled in SJTRunner
+                http_client=http_client,
+                cache=cache,
             )
         else:
             self.generator = generator
@@ -47,6 +64,9 @@ class SJTRunner:
             self.scale = scale
         if meta is not None:
             self.meta = meta
+        # filled in by self_prep; cook/cook_async fall back to them when given neither
+        self.items = None
+        self.confs = None
         if scale is not None and meta is not None:
             self.self_prep()
 
@@ -123,9 +143,12 @@ class SJTRunner:
         results_dir: str | None = None,
         detailed_fname: str = 'results_detailed',
         fname:str = 'results',
+        sequential: bool = False,
         ) -> dict:
         """
         Generates items for each trait using the specified generator.
+
+        All trait-item pairs are generated concurrently through :meth:`cook_async`.
         Parameters
         ----------
         traits : list
@@ -139,17 +162,33 @@ class SJTRunner:
             The number of items to generate for each source item (default is 3).
         model : str, optional
             The model to use for generation (default is 'gpt-5-mini').
+        sequential : bool, optional
+            Generate one item at a time with a blocking ``generator.run`` call per
+            source item instead of concurrently (useful for debugging). Defaults to False.
         Returns
         -------
         dict
             A dictionary where keys are trait names and values are lists of generated items.
         """
-        if hasattr(self, 'items') and hasattr(self, 'confs') and items is None and confs is None:
-            confs = self.confs
-            items = self.items
-        else:
-            if items is None or confs is None:
-                raise ValueError("Either both items and confs must be provided, or neither.")
+        if not sequential:
+            return self.cook_async(
+                traits,
+                items=items,
+                confs=confs,
+                n_item=n_item,
+                model=model,
+                trait_concurrency=None,
+                show_progress=True,
+                save_results=save_results,
+                results_dir=results_dir,
+                detailed_fname=detailed_fname,
+                fname=fname,
+            )
+
+        if items is None and confs is None and self.items is not None and self.confs is not None:
+            items, confs = self.items, self.confs
+        elif items is None or confs is None:
+            raise ValueError("Either both items and confs must be provided, or neither.")
             
         all_items = {}
         for trait in tqdm(traits, desc="Generating"):
@@ -175,7 +214,7 @@ class SJTRunner:
             )
         return all_items
 
-    async def _cook_async(
+    async def acook(
         self,
         traits: list,
         items: dict,
@@ -185,11 +224,16 @@ class SJTRunner:
         trait_concurrency: Optional[int] = None,
         show_progress: bool = True,
         progress_callback: Optional[callable] = None,
+        on_delta: Optional[callable] = None,
+        dedupe_items: bool = False,
     ):
         """
         Asynchronously generates items by scheduling each trait-item pair concurrently.
 
-        Parameters are the same as ``cook`` with two additions:
+        Await this directly when already inside an event loop (e.g. Gradio);
+        ``cook`` / ``cook_async`` are the synchronous entry points.
+
+        Parameters are the same as ``cook`` with these additions:
         trait_concurrency : int, optional
             Maximum number of trait-item tasks to process at once. Defaults to the
             total number of tasks (``len(traits) * len(items[trait])``), i.e. no throttling.
@@ -197,9 +241,16 @@ class SJTRunner:
             Whether to display tqdm progress bars. Defaults to True.
         progress_callback : callable, optional
             A callback function to report progress. Should accept (current, total, details) parameters.
+        on_delta : callable, optional
+            Streams LLM output for display. Called with (stage, chunk) for every
+            content chunk, where stage is e.g. ``'<trait_name>/trait_decoder'``.
+        dedupe_items : bool, optional
+            Generate once per distinct (trait, source item) and give repeated source
+            items a copy of that result instead of another LLM call. Defaults to False,
+            since repeats otherwise get independently sampled items.
         """
         if self.generator is None:
-            raise ValueError("Generator must be set before calling _cook_async method")
+            raise ValueError("Generator must be set before calling acook method")
             
         if not traits:
             return {}
@@ -215,63 +266,103 @@ class SJTRunner:
         else:
             concurrency_limit = max(1, min(trait_concurrency, total_tasks))
 
-        task_semaphore = asyncio.Semaphore(concurrency_limit)
+        # 所有 trait×item 任务的LLM请求共享同一个并发上限
+        request_semaphore = asyncio.Semaphore(self.generator.max_concurrency)
         all_items = {trait: [None] * trait_counts[trait] for trait in traits}
         completed_tasks = 0
+        # generator arguments that only depend on the trait, looked up once per trait
+        trait_kwargs = {
+            trait: {
+                'trait_name': confs[trait]['trait_name'],
+                'trait_description': confs[trait]['description'],
+                'low_score': confs[trait]['low_score'],
+                'high_score': confs[trait]['high_score'],
+            }
+            for trait in traits
+        }
+        # (trait_name, source_item) -> generation shared by repeated source items
+        shared_results: dict[tuple, asyncio.Future] = {}
 
         async def process_trait_item(trait_key: str, item_index: int, source_item):
             nonlocal completed_tasks
 
-            async with task_semaphore:
-                trait_conf = confs[trait_key]
-                try:
-                    result = await self.generator._generate_items(
-                        trait_name=trait_conf['trait_name'],
-                        trait_description=trait_conf['description'],
-                        low_score=trait_conf['low_score'],
-                        high_score=trait_conf['high_score'],
+            kwargs = trait_kwargs[trait_key]
+            key = (kwargs['trait_name'], source_item)
+            try:
+                if dedupe_items and key in shared_results:
+                    # copy so callers mutating one trait's results don't alias another
+                    result = copy.deepcopy(await shared_results[key])
+                else:
+                    generation = self.generator.agenerate_items(
+                        **kwargs,
                         item=source_item,
                         n_item=n_item,
                         model=model,
+                        semaphore=request_semaphore,
+                        on_delta=on_delta,
                     )
-                    completed_tasks += 1
-                    if progress_callback:
-                        progress_callback(
-                            completed_tasks,
-                            total_tasks,
-                            f"已完成 {trait_key} 特质的第 {item_index + 1} 个题目"
-                        )
-                except Exception as exc:  # pragma: no cover - surface trait context
-                    raise RuntimeError(
-                        f"Failed to generate items for trait {trait_key} at index {item_index}"
-                    ) from exc
-            return trait_key, item_index, result
+                    if dedupe_items:
+                        generation = shared_results[key] = asyncio.ensure_future(generation)
+                    result = await generation
+                completed_tasks += 1
+                if progress_callback:
+                    progress_callback(
+                        completed_tasks,
+                        total_tasks,
+                        f"已完成 {trait_key} 特质的第 {item_index + 1} 个题目"
+                    )
+            except Exception as exc:  # pragma: no cover - surface trait context
+                raise RuntimeError(
+                    f"Failed to generate items for trait {trait_key} at index {item_index}"
+                ) from exc
+            all_items[trait_key][item_index] = result
 
-        tasks = [
-            asyncio.create_task(process_trait_item(trait, idx, source_item))
-            for trait in traits
-            for idx, source_item in enumerate(items[trait])
-        ]
+        # 按预估长度（特质描述+源题目的字符数）从长到短提交，长任务先占并发槽，
+        # 避免最后只剩个别长请求拖尾
+        def estimated_length(job):
+            trait_key, _, source_item = job
+            return len(str(confs[trait_key]['description'])) + len(str(source_item))
 
-        pending_items = asyncio.as_completed(tasks)
-        if show_progress:
-            pending_items = tqdm(pending_items, total=len(tasks), desc="Generating")
+        jobs = sorted(
+            (
+                (trait, idx, source_item)
+                for trait in traits
+                for idx, source_item in enumerate(items[trait])
+            ),
+            key=estimated_length,
+            reverse=True,
+        )
+        # 只启动 concurrency_limit 个worker依次领取任务，而不是为每个任务创建一个Task
+        pending_jobs = iter(jobs)
+        # mininterval合并高频完成时的刷新，避免渲染占用事件循环
+        progress = tqdm(total=total_tasks, desc="Generating", mininterval=0.5) if show_progress else None
 
+        async def worker():
+            for job in pending_jobs:
+                await process_trait_item(*job)
+                if progress is not None:
+                    progress.update(1)
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency_limit)]
         try:
-            for fut in pending_items:
-                trait_key, item_index, item_result = await fut
-                all_items[trait_key][item_index] = item_result
+            await asyncio.gather(*workers)
         except Exception:
-            for task in tasks:
+            for task in workers:
                 task.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.gather(*workers, return_exceptions=True)
             raise
+        finally:
+            if progress is not None:
+                progress.close()
 
         return {
             trait: [item for item in results if item is not None]
             for trait, results in all_items.items()
         }
 
+    # former name, kept for existing callers
+    _cook_async = acook
+
     def cook_async(
         self,
         traits: list,
@@ -282,13 +373,19 @@ class SJTRunner:
         trait_concurrency: Optional[int] = None,
         show_progress: bool = True,
         progress_callback: Optional[callable] = None,
+        on_delta: Optional[callable] = None,
+        dedupe_items: bool = False,
 
         save_results: Optional[bool] = False,
         results_dir: str | None = None,
         detailed_fname: str = 'results_detailed',
         fname:str = 'results',
     ) -> dict:
-        """Synchronous helper that executes :func:`_cook_async` in any environment.
+        """Synchronous helper that executes :meth:`acook` in any environment.
+
+        Inside a running event loop (e.g. Jupyter) the work runs on a shared
+        background loop thread; set ``SJT_NEST_ASYNCIO=1`` to re-enter the
+        caller's loop through ``nest_asyncio`` instead.
         Parameters
         ----------
         traits : list
@@ -309,21 +406,23 @@ class SJTRunner:
             Whether to display tqdm progress bars. Defaults to True.
         progress_callback : callable, optional
             A callback function to report progress. Should accept (current, total, details) parameters.
+        on_delta : callable, optional
+            Streams LLM output for display. Called with (stage, chunk) for every content chunk.
+        dedupe_items : bool, optional
+            Reuse one generation for repeated (trait, source item) pairs (default is False).
         Returns
         -------
         dict
             A dictionary where keys are trait names and values are lists of generated items.
 
         """
-        if hasattr(self, 'items') and hasattr(self, 'confs') and items is None and confs is None:
-            confs = self.confs
-            items = self.items
-        else:
-            if items is None or confs is None:
-                raise ValueError("Either both items and confs must be provided, or neither.")
+        if items is None and confs is None and self.items is not None and self.confs is not None:
+            items, confs = self.items, self.confs
+        elif items is None or confs is None:
+            raise ValueError("Either both items and confs must be provided, or neither.")
         
         async def _run():
-            return await self._cook_async(
+            return await self.acook(
                 traits=traits,
                 items=items,
                 confs=confs,
@@ -332,6 +431,8 @@ class SJTRunner:
                 trait_concurrency=trait_concurrency,
                 show_progress=show_progress,
                 progress_callback=progress_callback,
+                on_delta=on_delta,
+                dedupe_items=dedupe_items,
             )
 
         try:
@@ -339,9 +440,13 @@ class SJTRunner:
         except RuntimeError:
             res = asyncio.run(_run())
         else:
-            import nest_asyncio
-            nest_asyncio.apply()
-            res = loop.run_until_complete(_run())
+            if os.environ.get('SJT_NEST_ASYNCIO'):
+                # opt-in fallback: re-enter the caller's loop
+                import nest_asyncio
+                nest_asyncio.apply()
+                res = loop.run_until_complete(_run())
+            else:
+                res = asyncio.run_coroutine_threadsafe(_run(), get_background_loop()).result()
         if save_results:
             self.save_result(
                 all_items=res,
@@ -359,29 +464,31 @@ class SJTRunner:
         fname:str = 'results',
     ) -> None:
         import os.path as op
-        import json
         import os
         from .res2doc import res_to_doc
         
-        final_item = {
-            trait: {
-                str(i): sjt
-                for i, sjt in enumerate(
-                    (s for data in res for s in data['items']), 1
-                )
-            }
-            for trait, res in all_items.items()
-        }
+        def numbered(res):
+            # generated items of one trait, numbered from 1 across all source items
+            return ((str(i), sjt) for i, sjt in enumerate((s for data in res for s in data['items']), 1))
+
         os.makedirs(results_dir, exist_ok=True)
         p_detailed = op.join(results_dir, f'{detailed_fname}.json')
         p = op.join(results_dir, f'{fname}.json')
         p_docx = op.join(results_dir, f'{fname}.docx')
         
-        with open(p_detailed, 'w', encoding='utf-8') as f:
-            json.dump(all_items, f, ensure_ascii=False, indent=2)
-        print(f"Detailed results saved to {p_detailed}")
-        with open(p, 'w', encoding='utf-8') as f:
-            json.dump(final_item, f, ensure_ascii=False, indent=2)
-        print(f"Results saved to {p}")
-        res_to_doc(final_item, p_docx)
-        print(f"Results document saved to {p_docx}")
\ No newline at end of file
+        # the three outputs are independent; write them concurrently (orjson, zlib
+        # and file writes release the GIL). The detailed dump is only read back
+        # by code, so keep it compact.
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            futures = [
+                (pool.submit(dump_json_stream, iter(all_items.items()), p_detailed),
+                 f"Detailed results saved to {p_detailed}"),
+                (pool.submit(dump_json_stream,
+                             ((trait, numbered(res)) for trait, res in all_items.items()), p, indent=True),
+                 f"Results saved to {p}"),
+                (pool.submit(res_to_doc, {trait: numbered(res) for trait, res in all_items.items()}, p_docx),
+                 f"Results document saved to {p_docx}"),
+            ]
+        for future, message in futures:
+            future.result()
+            print(message)
@@ -0,0 +1 @@
+from .io import dump_json, dump_json_stream
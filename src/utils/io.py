@@ -0,0 +1,82 @@
+"""JSON output helpers shared by the generation runner and the evaluators."""
+from collections.abc import Iterable, Iterator
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+
+def dump_json(obj, path: str, indent: bool = False) -> None:
+    """
+    Write ``obj`` to ``path`` as UTF-8 JSON, using orjson when it is installed.
+
+    Parameters
+    ----------
+    obj : Any
+        JSON-serializable object (NumPy scalars and arrays are accepted with orjson).
+        Non-string keys (e.g. item numbers) are written as strings, as with ``json``.
+    path : str
+        Output file path.
+    indent : bool, optional
+        Pretty-print with two-space indentation (default is compact output).
+    """
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(obj, option=option))
+    else:
+        import json
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, ensure_ascii=False, indent=2 if indent else None)
+
+
+def _encode_json(obj, indent: bool = False) -> bytes:
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option)
+    import json
+    return json.dumps(
+        obj, ensure_ascii=False, indent=2 if indent else None, separators=(',', ': ' if indent else ':')
+    ).encode('utf-8')
+
+
+def _write_json_members(f, members: Iterable, indent: bool, level: int) -> None:
+    """Write ``(key, value)`` pairs as one JSON object; iterator values become nested objects."""
+    pad = b'\n' + b'  ' * (level + 1) if indent else b''
+    f.write(b'{')
+    empty = True
+    for key, value in members:
+        f.write(pad if empty else b',' + pad)
+        empty = False
+        f.write(_encode_json(str(key)) + (b': ' if indent else b':'))
+        if isinstance(value, Iterator):
+            _write_json_members(f, value, indent, level + 1)
+        else:
+            data = _encode_json(value, indent)
+            # JSON strings never contain raw newlines, so this only re-indents structure
+            f.write(data.replace(b'\n', pad) if indent else data)
+    if indent and not empty:
+        f.write(b'\n' + b'  ' * level)
+    f.write(b'}')
+
+
+def dump_json_stream(members: Iterable, path: str, indent: bool = False) -> None:
+    """
+    Write a JSON object to ``path`` one member at a time.
+
+    Only one member is encoded at a time, so the object never has to be built
+    (or serialized) in memory as a whole. Values are encoded as in :func:`dump_json`.
+
+    Parameters
+    ----------
+    members : iterable of (key, value)
+        Object members in output order. A value that is an iterator of
+        ``(key, value)`` pairs is written as a nested object, also lazily.
+    path : str
+        Output file path.
+    indent : bool, optional
+        Pretty-print with two-space indentation (default is compact output).
+    """
+    with open(path, 'wb') as f:
+        _write_json_members(f, members, indent, 0)
@@ -1,8 +1,16 @@
 # %%
-from lmitf import TemplateLLM
 import os.path as op
 import asyncio
+import json
+import os
+from functools import partial
+from typing import Callable
+import httpx
 from tqdm import tqdm
+from tqdm.asyncio import tqdm_asyncio
+
+from ..llm_cache import ResponseCache
+from ..llm_client import AsyncTemplateLLM, get_background_loop
 
 
 class SJTAgent:
@@ -12,10 +20,14 @@ class SJTAgent:
         target_population="大学生",
         max_concurrency: int = 100,
         show_progress: bool = True,
+        http_client: httpx.AsyncClient | None = None,
+        cache: ResponseCache | None = None,
         ):
         """
         situation_theme: 场景主题
         max_concurrency: 最大并发度（根据你的接口限速能力调整）
+        http_client: 共享的连接池客户端；不传则使用当前事件循环上的共享客户端
+        cache: 响应缓存；完全相同的请求直接复用已有结果（默认关闭，调试重跑时使用）
         """
         self.situation_theme = situation_theme
         self.target_population = target_population
@@ -31,13 +43,13 @@ class SJTAgent:
         td_prompt = op.join(current_dir, "prompts", "trait_decoder.py")
         tp_prompt = op.join(current_dir, "prompts", "trait_polisher.py")
 
-        self.ba = TemplateLLM(ba_prompt)
-        self.sb_a = TemplateLLM(sb_prompt_a)
-        self.sb_b = TemplateLLM(sb_prompt_b)
-        self.td = TemplateLLM(td_prompt)
-        self.tp = TemplateLLM(tp_prompt)
+        self.ba = AsyncTemplateLLM(ba_prompt, http_client=http_client, cache=cache)
+        self.sb_a = AsyncTemplateLLM(sb_prompt_a, http_client=http_client, cache=cache)
+        self.sb_b = AsyncTemplateLLM(sb_prompt_b, http_client=http_client, cache=cache)
+        self.td = AsyncTemplateLLM(td_prompt, http_client=http_client, cache=cache)
+        self.tp = AsyncTemplateLLM(tp_prompt, http_client=http_client, cache=cache)
 
-    async def _generate_items(
+    async def agenerate_items(
         self, 
         trait_name,
         trait_description,
@@ -46,106 +58,159 @@ class SJTAgent:
         item, 
         n_item,
         model = 'gpt-4o',
+        semaphore: asyncio.Semaphore | None = None,
+        on_delta: Callable[[str, str], None] | None = None,
+        output_path: str | None = None,
         ):
+        """
+        异步生成接口：已在事件循环中（Jupyter、Gradio）时直接 await 本方法，
+        同步调用使用 run
+
+        semaphore: 限制LLM请求并发的信号量；批量调用时由调用方传入同一个，
+            使所有特质/题目的请求共享 max_concurrency 上限
+        on_delta: 流式输出回调 (stage, chunk)；stage 标识是哪一步的请求，
+            仅用于展示，返回结果仍在各步完整解析JSON后给出
+        output_path: 若给出，每个情景完成即追加写入该 JSONL 文件（每行一个），
+            中途出错时已完成的情景仍在文件里；返回结果的 items 不变，
+            文件路径记在 items_path 中
+        """
         final_item = {}
         final_item['source'] = item
+        sem = semaphore or asyncio.Semaphore(self.max_concurrency)
 
-        # 放线程池，避免阻塞事件循环
-        res_td = await asyncio.to_thread(
-            self.td.call,
-            trait_name=trait_name,
-            target_population=self.target_population,
-            trait_description=trait_description,
-            low_score=low_score,
-            high_score=high_score,
-            item=item,
-            response_format="json",
-            model=model
-        )
-        res_tp = await asyncio.to_thread(
-            self.tp.call,
-            trait_name=trait_name,
-            target_population=self.target_population,
-            trait_description=trait_description,
-            low_score=res_td['low_score'],
-            high_score=res_td['high_score'],
-            response_format="json",
-            model=model
-        )
+        def stream_to(stage):
+            return None if on_delta is None else partial(on_delta, f"{trait_name}/{stage}")
 
-        cues = await asyncio.to_thread(
-            self.sb_a.call,
-            trait_name=trait_name,
-            target_population=self.target_population,
-            situation_theme=self.situation_theme,
-            n_cue=n_item,
-            low_score=res_tp['low_score'],
-            high_score=res_tp['high_score'],
-            response_format="json",
-            model=model
-        )
+        # 原生异步请求，复用同一连接池
+        async with sem:
+            res_td = await self.td.acall(
+                on_delta=stream_to('trait_decoder'),
+                trait_name=trait_name,
+                target_population=self.target_population,
+                trait_description=trait_description,
+                low_score=low_score,
+                high_score=high_score,
+                item=item,
+                response_format="json",
+                model=model
+            )
+        async with sem:
+            res_tp = await self.tp.acall(
+                on_delta=stream_to('trait_polisher'),
+                trait_name=trait_name,
+                target_population=self.target_population,
+                trait_description=trait_description,
+                low_score=res_td['low_score'],
+                high_score=res_td['high_score'],
+                response_format="json",
+                model=model
+            )
+
+        # 润色后的高/低分描述要填入其后每一个请求（每个线索两次），先转成文本只做一次
+        low_score_text = str(res_tp['low_score'])
+        high_score_text = str(res_tp['high_score'])
+
+        async with sem:
+            cues = await self.sb_a.acall(
+                on_delta=stream_to('scenario_builder_a'),
+                trait_name=trait_name,
+                target_population=self.target_population,
+                situation_theme=self.situation_theme,
+                n_cue=n_item,
+                low_score=low_score_text,
+                high_score=high_score_text,
+                response_format="json",
+                model=model
+            )
         self.res_td = res_td
         self.res_tp = res_tp
         self.res_sb_a = cues
+        self._html = None  # 结果已变，下次展示时重新生成
 
-        cue_list = cues.get("cues", [])
-        sem = asyncio.Semaphore(self.max_concurrency)
+        # 模型偶尔给出完全相同的触发事件，相同的线索只生成一次；非字符串的线索
+        # （格式异常的回复）不参与去重，原样交给 process_cue，只影响该线索本身
+        seen_cues = set()
+        cue_list = []
+        for cue in cues.get("cues", []):
+            if isinstance(cue, str):
+                if cue in seen_cues:
+                    continue
+                seen_cues.add(cue)
+            cue_list.append(cue)
 
-        async def process_cue(cue):
-            async with sem:
-                try:
-                    res_sb_b = await asyncio.to_thread(
-                        self.sb_b.call,
+        async def process_cue(cue_idx, cue):
+            try:
+                async with sem:
+                    res_sb_b = await self.sb_b.acall(
+                        on_delta=stream_to(f'scenario_builder_b[{cue_idx}]'),
                         trait_name=trait_name,
                         target_population=self.target_population,
                         cue=cue,
                         n_situ=1,
-                        low_score=res_tp['low_score'],
-                        high_score=res_tp['high_score'],
+                        low_score=low_score_text,
+                        high_score=high_score_text,
                         response_format="json",
                         model=model
                     )
 
-                    res_ba = await asyncio.to_thread(
-                        self.ba.call,
+                async with sem:
+                    res_ba = await self.ba.acall(
+                        on_delta=stream_to(f'behavior_adapter[{cue_idx}]'),
                         situation=res_sb_b["situation"][0],
                         trait_name=trait_name,
                         target_population=self.target_population,
-                        low_score=res_tp['low_score'],
-                        high_score=res_tp['high_score'],
+                        low_score=low_score_text,
+                        high_score=high_score_text,
                         response_format="json",
                         model=model
                     )
 
-                    return {
-                        "situation": res_sb_b["situation"][0],
-                        "options": res_ba["options"],
-                    }
-                except Exception as e:
-                    return {
-                        "error": repr(e),
-                        "cue": cue,
-                    }
-
-        tasks = [process_cue(cue) for cue in cue_list]
-
-        results = []
-        if self.show_progress:
-            for fut in tqdm(
-                asyncio.as_completed(tasks),
-                total=len(tasks),
-                desc=f"Generating {trait_name}'s {n_item} sjts from source item",
-                leave=False
-            ):
-                results.append(await fut)
+                return {
+                    "situation": res_sb_b["situation"][0],
+                    "options": res_ba["options"],
+                }
+            except Exception as e:
+                return {
+                    "error": repr(e),
+                    "cue": cue,
+                }
+
+        tasks = [process_cue(idx, cue) for idx, cue in enumerate(cue_list, 1)]
+
+        progress = dict(
+            desc=f"Generating {trait_name}'s {n_item} sjts from source item",
+            leave=False,
+            mininterval=0.5,
+        )
+
+        if output_path is None:
+            # process_cue 自行捕获异常，gather 不会中途失败；结果按线索顺序排列
+            if self.show_progress:
+                results = await tqdm_asyncio.gather(*tasks, **progress)
+            else:
+                results = await asyncio.gather(*tasks)
         else:
-            for fut in asyncio.as_completed(tasks):
-                results.append(await fut)
+            async def indexed(idx, coro):
+                return idx, await coro
+
+            results = [None] * len(tasks)
+            completed = asyncio.as_completed([indexed(idx, coro) for idx, coro in enumerate(tasks)])
+            if self.show_progress:
+                completed = tqdm(completed, total=len(tasks), **progress)
+            # 边完成边写盘（完成顺序），返回的结果仍按线索顺序排列
+            with open(output_path, 'a', encoding='utf-8') as f:
+                for fut in completed:
+                    idx, result = await fut
+                    results[idx] = result
+                    f.write(json.dumps(result, ensure_ascii=False) + '\n')
+                    f.flush()
 
         final_item['n_item'] = n_item
         final_item['trait_decoder'] = res_td
         final_item['trait_polisher'] = res_tp
         final_item['cues'] = cue_list
+        if output_path is not None:
+            final_item['items_path'] = output_path
         if n_item == 1:
             final_item['items'] = results[0]
         else:
@@ -155,6 +220,9 @@ class SJTAgent:
 
         return final_item
 
+    # 旧名称，保留给已有调用方
+    _generate_items = agenerate_items
+
     def run(
         self, 
         trait_name, 
@@ -164,26 +232,94 @@ class SJTAgent:
         item, 
         n_item, 
         model = 'gpt-4o',
+        output_path = None,
         ):
+        return self._run_sync(self.agenerate_items(
+            trait_name,
+            trait_description,
+            low_score,
+            high_score,
+            item, n_item, model=model, output_path=output_path))
+
+    def run_batch(
+        self,
+        requests,
+        model = 'gpt-4o',
+        ):
+        """
+        一次生成多组题目：requests 为若干个 dict，键同 run 的参数
+        (trait_name, trait_description, low_score, high_score, item, n_item)；
+        所有请求并发执行并共用一个信号量，总并发不超过 max_concurrency。
+        返回结果与 requests 顺序一致
+        """
+        async def generate_all():
+            sem = asyncio.Semaphore(self.max_concurrency)
+            return await asyncio.gather(*(
+                self.agenerate_items(**request, model=model, semaphore=sem)
+                for request in requests
+            ))
+
+        return self._run_sync(generate_all())
+
+    @staticmethod
+    def _run_sync(coro):
+        """
+        同步执行协程：没有运行中的事件循环时直接 asyncio.run；
+        在 Jupyter 等已有循环中时交给后台线程的事件循环执行，不修改调用方的循环。
+        设置 SJT_NEST_ASYNCIO=1 可改回用 nest_asyncio 重入调用方的循环
+        """
         try:
             loop = asyncio.get_running_loop()
         except RuntimeError:
-            result = asyncio.run(self._generate_items(
-                trait_name,
-                trait_description,
-                low_score,
-                high_score,
-                item, n_item, model=model))
-        else:
+            return asyncio.run(coro)
+        if os.environ.get('SJT_NEST_ASYNCIO'):
             import nest_asyncio
 
             nest_asyncio.apply()
-            result = loop.run_until_complete(self._generate_items(trait_name, trait_description, low_score, high_score, item, n_item, model=model))
-        return result
+            return loop.run_until_complete(coro)
+        return asyncio.run_coroutine_threadsafe(coro, get_background_loop()).result()
     
+    async def run_stream(
+        self,
+        trait_name,
+        trait_description,
+        low_score,
+        high_score,
+        item,
+        n_item,
+        model = 'gpt-4o',
+        ):
+        """
+        流式运行：边生成边产出 (stage, chunk)，供界面实时展示；
+        结束后完整结果在 self.generated_items 中
+        """
+        queue = asyncio.Queue()
+        task = asyncio.create_task(self.agenerate_items(
+            trait_name,
+            trait_description,
+            low_score,
+            high_score,
+            item, n_item, model=model,
+            on_delta=lambda stage, chunk: queue.put_nowait((stage, chunk)),
+        ))
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (delta := await queue.get()) is not None:
+                yield delta
+        finally:
+            if not task.done():
+                task.cancel()
+        await task
+
     def _repr_html_(self):
         if not hasattr(self, 'res_td') or not hasattr(self, 'res_sb_a'):
             return "<p>No generation results available. Please run <code>run</code> first.</p>"
+        # Jupyter 每次显示都会调用；结果不变时复用上次生成的 HTML
+        if self._html is None:
+            self._html = self._build_html()
+        return self._html
+
+    def _build_html(self):
         import pandas as pd
         # Create DataFrame for trait decoder results
         td_df = pd.DataFrame([self.res_td]).T
@@ -24,6 +24,10 @@ sys_prompt = """
 - 选项应涵盖从低到高的不同特质水平，确保不同选项具备良好区分度，在认知、情感和行为层面上有差异
 - 语言逻辑清晰，符合中文表达习惯
 
+# INPUT
+用户依次给出人口学信息、情景、心理构念(特质)、低分表现与高分表现。
+请在情景的约束下，根据构念及其相关的认知，行为与情绪特征设计该情景下不同特质水平的反应项。
+
 # OUTPUT
 以JSON格式返回结果，包含以下字段：
 {
@@ -45,7 +49,6 @@ sys_prompt = """
 """
 
 conditioned_frame = """
-请在情景的约束下，根据构念及其相关的认知，行为与情绪特征设计该情景下不同特质水平的反应项：
 人口学信息: $target_population
 情景: $situation
 心理构念(特质): $trait_name
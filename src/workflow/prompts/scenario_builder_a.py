@@ -15,12 +15,14 @@ sys_prompt = """你是一个心理学家,
 1.请确保分析准确深入，抓住题目核心测量的心理过程。
 2.触发事件具有普遍适用性，适用于任何职业、任何人群。
 3.只返回JSON格式数据，不要有其他文字。
+##输入
+用户依次给出人口学信息、触发事件数量、情景主题、心理构念(特质)、低分与高分特质描述。
+请在情景主题的框架下，根据构念及其相关的认知，行为与情绪特征设计所要求数量的、能够激活特质的触发事件。
 """
 
 conditioned_frame = """
-请基于用户的人口学信息: $target_population,
-在情景主题的框架下，根据构念及其相关的认知，行为与情绪特征设计能够激活特质的 $n_cue 个触发事件：
-
+人口学信息: $target_population
+触发事件数量: $n_cue
 情景主题: $situation_theme
 心理构念(特质): $trait_name
 低分特质描述: $low_score
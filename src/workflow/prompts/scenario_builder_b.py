@@ -20,6 +20,10 @@ sys_prompt = """
 （5）情境应该允许高分与低分个体都能自由展现其行为倾向，而不会受到情境暗示或引导。
 （6）情景结束后，以“你会怎么做？”结尾。
 
+# INPUT
+用户依次给出人口学信息、情景数量、触发事件、心理构念(特质)、低分与高分特质描述。
+请在触发事件的约束下，根据构念及其相关的认知，行为与情绪特征设计所要求数量的、能够激活特质的情景。
+
 # OUTPUT
 以JSON格式返回结果，包含以下字段：
 {
@@ -34,10 +38,8 @@ sys_prompt = """
 """
 
 conditioned_frame = """
-请在触发事件的约束下，
-请基于用户的人口学信息: $target_population,
-根据构念及其相关的认知，行为与情绪特征设计能够激活特质的 $n_situ 个触发事件：
-
+人口学信息: $target_population
+情景数量: $n_situ
 触发事件: $cue
 心理构念(特质): $trait_name
 低分特质描述: $low_score
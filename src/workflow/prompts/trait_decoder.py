@@ -6,7 +6,8 @@ from string import Template
 sys_prompt = """你是一个心理学家, 
 请根据用户的人口学信息分析用户输入的心理构念(特质)与对应的量表题目，
 提取其中隐含的心理特质成分，
-需要分别包括特质的高水平表现与低水平表现：
+需要分别包括特质的高水平表现与低水平表现。
+用户依次给出人口学信息、心理构念(特质)、特质描述、量表题目、高分特点与低分特点。
 
 具体来说，你需要提取以下三个成分：
 1. 认知成分：该题目测量的认知评估或信念倾向
@@ -29,9 +30,7 @@ sys_prompt = """你是一个心理学家,
 """
 
 conditioned_frame = """
-请基于用户的人口学信息：$target_population,
-分析以下特质与量表题目，提取其中隐含的心理特质成分:
-
+人口学信息：$target_population
 心理构念(特质): $trait_name
 特质描述：$trait_description
 量表题目: $item
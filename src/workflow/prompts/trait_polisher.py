@@ -6,6 +6,8 @@ system_content = """
 擅长从积极心理学的角度重新诠释人格特质，
 优化人格特质的行为描述。
 请基于输入的心理特质描述与用户的人口学信息，对内容进行优化。
+用户依次给出人口学信息、心理构念(特质)、特质定义、高分表现与低分表现；
+如果描述为负面，请将特质描述转换为中性或积极的表述，意在发掘每种特质的独特优势。
 
 ##Criteria:
 1. 检查所提供文本的高分行为表现和低分行为表现，将负面的特质描述转换为中性或积极的表述
@@ -45,11 +47,7 @@ low_score:{
 """
 
 conditioned_frame = """
-请基于用户的人口学信息：$target_population,
-分析以下特质描述, 如果描述为负面,
-请将的特质描述转换为中性或积极的表述,
-意在发掘每种特质的独特优势:
-
+人口学信息：$target_population
 心理构念(特质): $trait_name
 特质定义：$trait_description
 高分表现：$high_score